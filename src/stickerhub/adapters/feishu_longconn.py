@@ -13,6 +13,8 @@ logger = logging.getLogger(__name__)
 
 BindHandler = Callable[[str, str | None], Awaitable[str]]
 
+_BIND_COMMAND_RE = re.compile(r"(?<!\S)/bind(?:\s+([A-Za-z0-9]+))?")
+
 
 class FeishuLongConnectionReceiver:
     def __init__(
@@ -183,12 +185,12 @@ def _parse_bind_command(text: str) -> tuple[bool, str | None]:
     - /bind CODE
     - @机器人 /bind CODE
     """
-    if not text:
+    # 绝大多数消息不含 /bind，先做子串判断，跳过正则匹配
+    if not text or "/bind" not in text:
         return False, None
 
-    match = re.search(r"(?<!\S)/bind(?:\s+([A-Za-z0-9]+))?", text)
+    match = _BIND_COMMAND_RE.search(text)
     if not match:
         return False, None
 
-    arg = match.group(1)
-    return True, (arg.strip() if arg else None)
+    return True, match.group(1)
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import logging
+import time
 from typing import Literal
 
 import httpx
@@ -9,6 +11,9 @@ from stickerhub.utils.url_masking import mask_url
 
 logger = logging.getLogger(__name__)
 
+# tenant_access_token 有效期约 2 小时，提前刷新以免临界时刻请求失败
+_TENANT_TOKEN_REFRESH_MARGIN_SECONDS = 300
+
 
 class FeishuSender:
     def __init__(
@@ -19,30 +24,63 @@ class FeishuSender:
         self._app_id = app_id
         self._app_secret = app_secret
         self._base_url = "https://open.feishu.cn/open-apis"
+        self._tenant_token: str | None = None
+        self._tenant_token_expires_at = 0.0
+        self._tenant_token_lock = asyncio.Lock()
+        # 所有请求共用一个长连接客户端：新建客户端要在事件循环上同步构造 SSL 上下文，开销不小
+        self._client: httpx.AsyncClient | None = None
+
+    async def prepare(self) -> None:
+        """预取 tenant_access_token，便于调用方与素材转换并行执行。"""
+        if self._tenant_token and time.monotonic() < self._tenant_token_expires_at:
+            return
+        await self._get_tenant_token(self._get_client())
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        return self._client
 
     async def send(
         self, asset: StickerAsset, target_mode: Literal["bot", "webhook"], target: str
     ) -> None:
-        # 避免在日志中暴露 webhook URL 中的敏感 token
-        safe_target = target if target_mode == "bot" else mask_url(target)
-        logger.debug(
-            "准备发送图片到飞书: mode=%s target=%s file=%s mime=%s size=%s",
-            target_mode,
-            safe_target,
-            asset.file_name,
-            asset.mime_type,
-            len(asset.content),
-        )
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        if logger.isEnabledFor(logging.DEBUG):
+            # 避免在日志中暴露 webhook URL 中的敏感 token；脱敏有开销，仅在 DEBUG 开启时计算
+            safe_target = target if target_mode == "bot" else mask_url(target)
+            logger.debug(
+                "准备发送图片到飞书: mode=%s target=%s file=%s mime=%s size=%s",
+                target_mode,
+                safe_target,
+                asset.file_name,
+                asset.mime_type,
+                len(asset.content),
+            )
+        image_key = await self.upload(asset)
+        await self.send_uploaded(image_key, target_mode, target)
+
+    async def upload(self, asset: StickerAsset) -> str:
+        """上传图片，返回 image_key；与 send_uploaded 分开，便于调用方先并发上传再按顺序发送。"""
+        client = self._get_client()
+        token = await self._get_tenant_token(client)
+        return await self._upload_image(client, token, asset)
+
+    async def send_uploaded(
+        self, media_key: str, target_mode: Literal["bot", "webhook"], target: str
+    ) -> None:
+        client = self._get_client()
+        if target_mode == "bot":
             token = await self._get_tenant_token(client)
-            image_key = await self._upload_image(client, token, asset)
-            if target_mode == "bot":
-                await self._send_image_message(client, token, image_key, target)
-                return
-            if target_mode == "webhook":
-                await self._send_webhook_image(client, image_key=image_key, webhook_url=target)
-                return
-            raise RuntimeError(f"不支持的飞书目标类型: {target_mode}")
+            await self._send_image_message(client, token, media_key, target)
+            return
+        if target_mode == "webhook":
+            await self._send_webhook_image(client, image_key=media_key, webhook_url=target)
+            return
+        raise RuntimeError(f"不支持的飞书目标类型: {target_mode}")
 
     async def send_text(
         self,
@@ -55,39 +93,48 @@ class FeishuSender:
             receive_id_type,
             receive_id,
         )
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            token = await self._get_tenant_token(client)
-            response = await client.post(
-                f"{self._base_url}/im/v1/messages",
-                params={"receive_id_type": receive_id_type},
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "receive_id": receive_id,
-                    "msg_type": "text",
-                    "content": json.dumps({"text": text}),
-                },
-            )
-            payload = response.json()
-            if response.status_code != 200 or payload.get("code") != 0:
-                raise RuntimeError(f"发送飞书文本消息失败: {payload}")
-            logger.info("飞书文本消息已发送: receive_id=%s", receive_id)
+        client = self._get_client()
+        token = await self._get_tenant_token(client)
+        response = await client.post(
+            f"{self._base_url}/im/v1/messages",
+            params={"receive_id_type": receive_id_type},
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "receive_id": receive_id,
+                "msg_type": "text",
+                "content": json.dumps({"text": text}),
+            },
+        )
+        payload = response.json()
+        if response.status_code != 200 or payload.get("code") != 0:
+            raise RuntimeError(f"发送飞书文本消息失败: {payload}")
+        logger.info("飞书文本消息已发送: receive_id=%s", receive_id)
 
     async def send_webhook_text(self, text: str, webhook_url: str) -> None:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            await self._send_webhook_message(
-                client,
-                webhook_url=webhook_url,
-                message={
-                    "msg_type": "text",
-                    "content": {"text": text},
-                },
-            )
+        await self._send_webhook_message(
+            self._get_client(),
+            webhook_url=webhook_url,
+            message={
+                "msg_type": "text",
+                "content": {"text": text},
+            },
+        )
         logger.info("飞书 webhook 文本消息已发送")
 
     async def _get_tenant_token(self, client: httpx.AsyncClient) -> str:
+        if self._tenant_token and time.monotonic() < self._tenant_token_expires_at:
+            return self._tenant_token
+
+        async with self._tenant_token_lock:
+            # 等锁期间可能已有其他请求刷新完成
+            if self._tenant_token and time.monotonic() < self._tenant_token_expires_at:
+                return self._tenant_token
+            return await self._fetch_tenant_token(client)
+
+    async def _fetch_tenant_token(self, client: httpx.AsyncClient) -> str:
         response = await client.post(
             f"{self._base_url}/auth/v3/tenant_access_token/internal",
             json={
@@ -101,7 +148,12 @@ class FeishuSender:
         token = payload.get("tenant_access_token")
         if not token:
             raise RuntimeError("飞书 tenant_access_token 为空")
-        logger.debug("飞书 tenant_access_token 获取成功")
+        expire_seconds = int(payload.get("expire") or 0)
+        self._tenant_token = token
+        self._tenant_token_expires_at = (
+            time.monotonic() + expire_seconds - _TENANT_TOKEN_REFRESH_MARGIN_SECONDS
+        )
+        logger.debug("飞书 tenant_access_token 获取成功: expire=%s", expire_seconds)
         return token
 
     async def _upload_image(
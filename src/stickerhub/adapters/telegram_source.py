@@ -5,7 +5,9 @@ import re
 import secrets
 import time
 import zipfile
+from collections import OrderedDict
 from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
 from dataclasses import dataclass
 from math import ceil
 
@@ -21,6 +23,7 @@ from telegram import (
 )
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
@@ -32,7 +35,9 @@ from stickerhub.core.models import StickerAsset
 
 logger = logging.getLogger(__name__)
 
-AssetHandler = Callable[[StickerAsset], Awaitable[None]]
+# 转发分两步：AssetHandler 完成归一化与上传等准备工作，返回的 AssetDelivery 真正发出消息
+AssetDelivery = Callable[[], Awaitable[None]]
+AssetHandler = Callable[[StickerAsset], Awaitable[AssetDelivery | None]]
 BindHandler = Callable[[str, str | None], Awaitable[str]]
 WebhookBindHandler = Callable[[str, str], Awaitable[str]]
 PackBatchMarkerHandler = Callable[[str, int, int, int, int, str], Awaitable[None]]
@@ -41,9 +46,23 @@ NormalizeHandler = Callable[[StickerAsset], Awaitable[StickerAsset]]
 PACK_CALLBACK_PREFIX = "send_pack:"
 STOP_PACK_CALLBACK_PREFIX = "stop_pack:"
 BIND_MODE_CALLBACK_PREFIX = "bind_mode:"
+_PACK_CALLBACK_PREFIX_LEN = len(PACK_CALLBACK_PREFIX)
+_STOP_PACK_CALLBACK_PREFIX_LEN = len(STOP_PACK_CALLBACK_PREFIX)
+_BIND_MODE_CALLBACK_PREFIX_LEN = len(BIND_MODE_CALLBACK_PREFIX)
+_PACK_CALLBACK_MODES = frozenset({"feishu", "zip", "photos"})
+_BIND_MODE_CALLBACK_MODES = frozenset({"bot", "webhook"})
 PACK_REQUEST_TTL_SECONDS = 15 * 60
 WEBHOOK_BIND_REQUEST_TTL_SECONDS = 10 * 60
 PACK_BATCH_SIZE = 10
+# 同时处理的 Telegram 用户数；同一用户的多条更新共用一个名额
+CONCURRENT_UPDATES = PACK_BATCH_SIZE
+# 已接收但尚未处理完的更新上限，仅用于防止积压无限增长
+_MAX_PENDING_UPDATES = 256
+
+# 同一用户上一条更新处理完成时置位的 future，由 PerUserUpdateProcessor 为每条更新设置
+_previous_update_done: ContextVar[asyncio.Future[None] | None] = ContextVar(
+    "telegram_previous_update_done", default=None
+)
 
 
 @dataclass(slots=True)
@@ -67,6 +86,110 @@ class RunningStickerPackTask:
     cancel_requested: bool = False
 
 
+class RunningStickerPackTasks:
+    """运行中的整包任务：按 task_id 存取，同时维护按用户的索引，判断用户是否有任务只需一次查找。"""
+
+    __slots__ = ("_by_id", "_by_user")
+
+    def __init__(self) -> None:
+        self._by_id: dict[str, RunningStickerPackTask] = {}
+        self._by_user: dict[str, set[str]] = {}
+
+    def add(self, task: RunningStickerPackTask) -> None:
+        self._by_id[task.task_id] = task
+        self._by_user.setdefault(task.telegram_user_id, set()).add(task.task_id)
+
+    def get(self, task_id: str) -> RunningStickerPackTask | None:
+        return self._by_id.get(task_id)
+
+    def pop(self, task_id: str) -> RunningStickerPackTask | None:
+        task = self._by_id.pop(task_id, None)
+        if task is not None:
+            task_ids = self._by_user.get(task.telegram_user_id)
+            if task_ids is not None:
+                task_ids.discard(task_id)
+                if not task_ids:
+                    del self._by_user[task.telegram_user_id]
+        return task
+
+    def has_user(self, telegram_user_id: str) -> bool:
+        return telegram_user_id in self._by_user
+
+
+@dataclass(slots=True)
+class _UserUpdates:
+    # 该用户占用的跨用户名额（Semaphore.acquire 的 future）
+    slot: asyncio.Future[bool]
+    # 该用户最后到达的更新处理完成时置位
+    tail: asyncio.Future[None] | None = None
+    pending: int = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    按用户调度 Telegram 更新。
+
+    max_concurrent_users 限制同时处理的用户数；同一用户的后续更新共用该用户的名额，
+    不会占着名额等待而挡住其他用户。同一用户的多条更新并发执行下载、转换与上传，
+    处理函数在对外发送结果前调用 _wait_for_turn，按到达顺序依次输出。
+    """
+
+    __slots__ = ("_user_slots", "_users")
+
+    def __init__(self, max_concurrent_users: int) -> None:
+        # PTB 自带的信号量只作为积压上限，并发控制按用户进行
+        super().__init__(_MAX_PENDING_UPDATES)
+        self._user_slots = asyncio.Semaphore(max_concurrent_users)
+        self._users: dict[int, _UserUpdates] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[object]) -> None:
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            await coroutine
+            return
+
+        # 到达顺序在第一个 await 之前确定
+        state = self._users.get(user.id)
+        if state is None:
+            state = _UserUpdates(slot=asyncio.ensure_future(self._user_slots.acquire()))
+            self._users[user.id] = state
+        previous = state.tail
+        done: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        state.tail = done
+        state.pending += 1
+        token = _previous_update_done.set(previous)
+        try:
+            await asyncio.shield(state.slot)
+            await coroutine
+        finally:
+            _previous_update_done.reset(token)
+            # 先于上一条更新结束时，也要等上一条完成后才算完成，后续更新的顺序才不会被打乱
+            if previous is None or previous.done():
+                done.set_result(None)
+            else:
+                previous.add_done_callback(lambda _: done.set_result(None))
+            state.pending -= 1
+            if not state.pending:
+                del self._users[user.id]
+                if state.slot.done() and not state.slot.cancelled():
+                    self._user_slots.release()
+                else:
+                    state.slot.cancel()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+async def _wait_for_turn() -> None:
+    """等待同一用户先到达的更新处理完毕；未经 PerUserUpdateProcessor 调度时立即返回。"""
+    previous = _previous_update_done.get()
+    if previous is not None and not previous.done():
+        await asyncio.shield(previous)
+
+
 @dataclass(slots=True)
 class PendingWebhookBindRequest:
     telegram_user_id: str
@@ -113,15 +236,23 @@ def build_telegram_application(
     on_normalize: NormalizeHandler | None = None,
     feishu_enabled: bool = True,
 ) -> Application:
-    application = Application.builder().token(token).build()
-    pending_pack_requests: dict[str, PendingStickerPackRequest] = {}
-    running_pack_tasks: dict[str, RunningStickerPackTask] = {}
-    pending_webhook_requests: dict[str, PendingWebhookBindRequest] = {}
+    application = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .build()
+    )
+    # 待处理请求按创建时间先后排列，清理过期项时只需从队首弹出
+    pending_pack_requests: OrderedDict[str, PendingStickerPackRequest] = OrderedDict()
+    running_pack_tasks = RunningStickerPackTasks()
+    pending_webhook_requests: OrderedDict[str, PendingWebhookBindRequest] = OrderedDict()
 
     async def handle_bind(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if not update.message or not update.effective_user:
             return
 
+        await _wait_for_turn()
+
         _cleanup_pending_webhook_requests(pending_webhook_requests)
 
         try:
@@ -150,6 +281,7 @@ def build_telegram_application(
         query = update.callback_query
         if not query:
             return
+        await _wait_for_turn()
         await query.answer()
 
         _cleanup_pending_webhook_requests(pending_webhook_requests)
@@ -181,6 +313,8 @@ def build_telegram_application(
                 telegram_user_id=owner_telegram_user_id,
                 created_at=int(time.time()),
             )
+            # 同一用户重复发起时更新的是已有键，需移到队尾以保持按创建时间排序
+            pending_webhook_requests.move_to_end(owner_telegram_user_id)
             await query.edit_message_text(
                 "请直接发送飞书自定义机器人的 Webhook 地址。\n"
                 "示例：\n"
@@ -191,6 +325,7 @@ def build_telegram_application(
         del context
         if not update.message:
             return
+        await _wait_for_turn()
         await update.message.reply_text(build_telegram_usage_text(feishu_enabled))
 
     async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -211,35 +346,50 @@ def build_telegram_application(
                 asset.media_kind,
                 asset.mime_type,
             )
-            await on_asset(asset)
+            # 下载、转换与上传可与同一用户的其他更新并发进行，转发与回复再按到达顺序发出
+            deliver = await on_asset(asset)
 
-            # 单张贴纸发送后，在 Telegram 回复一份归一化后的原图
-            if update.message.sticker and update.effective_user:
+            effective_user = update.effective_user if update.message.sticker else None
+            normalized: StickerAsset | None = None
+            if effective_user:
                 effective_normalize = on_normalize or _identity_normalize
                 try:
                     normalized = await effective_normalize(asset)
-                    await _send_single_sticker_reply(
-                        message=update.message,
-                        normalized=normalized,
-                    )
                 except Exception:  # noqa: BLE001
                     logger.exception("回复单张贴纸原图失败")
 
+            await _wait_for_turn()
+            if deliver is not None:
+                await deliver()
+
+            # 单张贴纸发送后，在 Telegram 回复一份归一化后的原图
+            if effective_user:
+                if normalized is not None:
+                    try:
+                        await _send_single_sticker_reply(
+                            message=update.message,
+                            normalized=normalized,
+                        )
+                    except Exception:  # noqa: BLE001
+                        logger.exception("回复单张贴纸原图失败")
+
                 await _offer_send_pack_button(
                     message=update.message,
                     context=context,
-                    effective_user_id=str(update.effective_user.id),
+                    effective_user_id=str(effective_user.id),
                     pending_pack_requests=pending_pack_requests,
                     feishu_enabled=feishu_enabled,
                 )
         except Exception as exc:  # noqa: BLE001
             logger.exception("处理 Telegram 消息失败")
+            await _wait_for_turn()
             await update.message.reply_text(f"处理失败: {exc}")
 
     async def handle_send_pack_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
         if not query:
             return
+        await _wait_for_turn()
 
         await query.answer()
         _cleanup_pending_requests(pending_pack_requests)
@@ -291,7 +441,7 @@ def build_telegram_application(
             origin_chat_id=effective_chat.id,
             origin_message_id=query.message.message_id,
         )
-        running_pack_tasks[task_id] = running_task
+        running_pack_tasks.add(running_task)
 
         mode_labels = {"feishu": "发送到飞书", "zip": "打包 ZIP", "photos": "发送图片组"}
         mode_label = mode_labels.get(mode, mode)
@@ -350,7 +500,7 @@ def build_telegram_application(
         if not data.startswith(STOP_PACK_CALLBACK_PREFIX):
             return
 
-        task_id = data[len(STOP_PACK_CALLBACK_PREFIX) :]
+        task_id = data[_STOP_PACK_CALLBACK_PREFIX_LEN:]
         running_task = running_pack_tasks.get(task_id)
         if running_task is None:
             await query.answer("任务已结束或不存在", show_alert=True)
@@ -368,6 +518,7 @@ def build_telegram_application(
         del context
         if not update.message or not update.message.text:
             return
+        await _wait_for_turn()
         await update.message.reply_text(
             f"不支持的命令：{update.message.text}\n\n{build_telegram_usage_text(feishu_enabled)}"
         )
@@ -380,6 +531,7 @@ def build_telegram_application(
         if not update.message:
             return
 
+        await _wait_for_turn()
         _cleanup_pending_webhook_requests(pending_webhook_requests)
 
         if update.effective_user:
@@ -453,7 +605,7 @@ async def _run_sticker_pack_task(
     running_task: RunningStickerPackTask,
     on_asset: AssetHandler,
     on_pack_batch_marker: PackBatchMarkerHandler | None,
-    running_pack_tasks: dict[str, RunningStickerPackTask],
+    running_pack_tasks: RunningStickerPackTasks,
 ) -> None:
     bot = context.bot
 
@@ -568,7 +720,7 @@ async def _run_sticker_pack_task(
             reply_markup=None,
         )
     finally:
-        running_pack_tasks.pop(running_task.task_id, None)
+        running_pack_tasks.pop(running_task.task_id)
 
 
 async def _send_batch_concurrently(
@@ -587,7 +739,9 @@ async def _send_batch_concurrently(
                 source_user_id=source_user_id,
                 file_prefix=file_prefix,
             )
-            await on_asset(asset)
+            deliver = await on_asset(asset)
+            if deliver is not None:
+                await deliver()
             return True
         except Exception:  # noqa: BLE001
             logger.exception(
@@ -605,10 +759,10 @@ async def _send_batch_concurrently(
 
 
 def _has_running_task_for_user(
-    running_pack_tasks: dict[str, RunningStickerPackTask],
+    running_pack_tasks: RunningStickerPackTasks,
     telegram_user_id: str,
 ) -> bool:
-    return any(task.telegram_user_id == telegram_user_id for task in running_pack_tasks.values())
+    return running_pack_tasks.has_user(telegram_user_id)
 
 
 async def _edit_task_message(
@@ -659,7 +813,7 @@ async def _offer_send_pack_button(
     message: Message,
     context: ContextTypes.DEFAULT_TYPE,
     effective_user_id: str,
-    pending_pack_requests: dict[str, PendingStickerPackRequest],
+    pending_pack_requests: OrderedDict[str, PendingStickerPackRequest],
     feishu_enabled: bool = True,
 ) -> None:
     sticker = message.sticker
@@ -866,6 +1020,7 @@ async def _build_sticker_asset(
         file_name=f"{file_prefix}_{sticker.file_unique_id}{extension}",
         content=content,
         is_animated=bool(sticker.is_animated or sticker.is_video),
+        pack_name=sticker.set_name,
     )
 
 
@@ -889,13 +1044,11 @@ def _detect_sticker_mime(sticker: Sticker) -> str:
     - 新版本可能没有 sticker.mime_type
     - 需要根据 is_animated / is_video 推断真实格式
     """
-    try:
-        legacy_mime = sticker.mime_type  # type: ignore[attr-defined]
-    except AttributeError:
-        legacy_mime = None
-
-    if isinstance(legacy_mime, str) and legacy_mime.strip():
-        return legacy_mime.strip().lower()
+    legacy_mime = getattr(sticker, "mime_type", None)
+    if isinstance(legacy_mime, str):
+        legacy_mime = legacy_mime.strip()
+        if legacy_mime:
+            return legacy_mime.lower()
 
     if sticker.is_video:
         return "video/webm"
@@ -904,28 +1057,26 @@ def _detect_sticker_mime(sticker: Sticker) -> str:
     return "image/webp"
 
 
-def _cleanup_pending_requests(pending_pack_requests: dict[str, PendingStickerPackRequest]) -> None:
-    now = int(time.time())
-    expired = [
-        token
-        for token, req in pending_pack_requests.items()
-        if now - req.created_at > PACK_REQUEST_TTL_SECONDS
-    ]
-    for token in expired:
-        pending_pack_requests.pop(token, None)
+def _cleanup_pending_requests(
+    pending_pack_requests: OrderedDict[str, PendingStickerPackRequest],
+) -> None:
+    # 按创建时间有序，遇到第一个未过期的请求即可停止，只遍历过期部分；
+    # 截止时间只算一次，循环内仅做整数比较
+    cutoff = int(time.time()) - PACK_REQUEST_TTL_SECONDS
+    while pending_pack_requests:
+        if next(iter(pending_pack_requests.values())).created_at >= cutoff:
+            break
+        pending_pack_requests.popitem(last=False)
 
 
 def _cleanup_pending_webhook_requests(
-    pending_webhook_requests: dict[str, PendingWebhookBindRequest],
+    pending_webhook_requests: OrderedDict[str, PendingWebhookBindRequest],
 ) -> None:
-    now = int(time.time())
-    expired_users = [
-        user_id
-        for user_id, req in pending_webhook_requests.items()
-        if now - req.created_at > WEBHOOK_BIND_REQUEST_TTL_SECONDS
-    ]
-    for user_id in expired_users:
-        pending_webhook_requests.pop(user_id, None)
+    cutoff = int(time.time()) - WEBHOOK_BIND_REQUEST_TTL_SECONDS
+    while pending_webhook_requests:
+        if next(iter(pending_webhook_requests.values())).created_at >= cutoff:
+            break
+        pending_webhook_requests.popitem(last=False)
 
 
 def _safe_pack_name(set_name: str) -> str:
@@ -936,12 +1087,8 @@ def _parse_pack_callback_data(data: str) -> tuple[str, str] | None:
     """解析整包发送回调数据，返回 (mode, token) 或 None。"""
     if not data.startswith(PACK_CALLBACK_PREFIX):
         return None
-    rest = data[len(PACK_CALLBACK_PREFIX) :]
-    parts = rest.split(":", 1)
-    if len(parts) != 2:
-        return None
-    mode, token = parts
-    if mode not in {"feishu", "zip", "photos"}:
+    mode, sep, token = data[_PACK_CALLBACK_PREFIX_LEN:].partition(":")
+    if not sep or not token or mode not in _PACK_CALLBACK_MODES:
         return None
     return mode, token
 
@@ -949,14 +1096,8 @@ def _parse_pack_callback_data(data: str) -> tuple[str, str] | None:
 def _parse_bind_mode_callback_data(data: str) -> tuple[str, str] | None:
     if not data.startswith(BIND_MODE_CALLBACK_PREFIX):
         return None
-    rest = data[len(BIND_MODE_CALLBACK_PREFIX) :]
-    parts = rest.split(":", 1)
-    if len(parts) != 2:
-        return None
-    mode, telegram_user_id = parts
-    if mode not in {"bot", "webhook"}:
-        return None
-    if not telegram_user_id:
+    mode, sep, telegram_user_id = data[_BIND_MODE_CALLBACK_PREFIX_LEN:].partition(":")
+    if not sep or not telegram_user_id or mode not in _BIND_MODE_CALLBACK_MODES:
         return None
     return mode, telegram_user_id
 
@@ -1004,7 +1145,7 @@ async def _run_sticker_pack_task_zip(
     request: PendingStickerPackRequest,
     running_task: RunningStickerPackTask,
     on_normalize: NormalizeHandler,
-    running_pack_tasks: dict[str, RunningStickerPackTask],
+    running_pack_tasks: RunningStickerPackTasks,
 ) -> None:
     """整包打包为 ZIP 任务：下载、归一化后打包为 ZIP 发送到 Telegram。"""
     bot = context.bot
@@ -1085,8 +1226,9 @@ async def _run_sticker_pack_task_zip(
         zip_buffer = io.BytesIO()
         with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
             seen_names: set[str] = set()
+            name_counters: dict[str, int] = {}
             for asset in collected:
-                name = _deduplicate_filename(asset.file_name, seen_names)
+                name = _deduplicate_filename(asset.file_name, seen_names, name_counters)
                 seen_names.add(name)
                 zf.writestr(name, asset.content)
 
@@ -1131,7 +1273,7 @@ async def _run_sticker_pack_task_zip(
             reply_markup=None,
         )
     finally:
-        running_pack_tasks.pop(running_task.task_id, None)
+        running_pack_tasks.pop(running_task.task_id)
 
 
 async def _run_sticker_pack_task_photos(
@@ -1139,7 +1281,7 @@ async def _run_sticker_pack_task_photos(
     request: PendingStickerPackRequest,
     running_task: RunningStickerPackTask,
     on_normalize: NormalizeHandler,
-    running_pack_tasks: dict[str, RunningStickerPackTask],
+    running_pack_tasks: RunningStickerPackTasks,
 ) -> None:
     """整包以图片组形式发送到 Telegram 聊天。"""
     bot = context.bot
@@ -1249,7 +1391,7 @@ async def _run_sticker_pack_task_photos(
             reply_markup=None,
         )
     finally:
-        running_pack_tasks.pop(running_task.task_id, None)
+        running_pack_tasks.pop(running_task.task_id)
 
 
 async def _send_telegram_media_group_safe(
@@ -1292,8 +1434,13 @@ async def _send_telegram_media_group_safe(
         return sent, failed
 
 
-def _deduplicate_filename(name: str, seen: set[str]) -> str:
-    """处理 ZIP 内文件名冲突。"""
+def _deduplicate_filename(name: str, seen: set[str], counters: dict[str, int] | None = None) -> str:
+    """
+    处理 ZIP 内文件名冲突。
+
+    counters 记录每个文件名下一个可尝试的序号；同一批次传入同一个字典，
+    大量同名文件时无需每次都从 _1 开始重新探测。
+    """
     if name not in seen:
         return name
     dot_pos = name.rfind(".")
@@ -1301,9 +1448,11 @@ def _deduplicate_filename(name: str, seen: set[str]) -> str:
         stem, suffix = name[:dot_pos], name[dot_pos:]
     else:
         stem, suffix = name, ""
-    counter = 1
+    counter = counters.get(name, 1) if counters is not None else 1
     while True:
         candidate = f"{stem}_{counter}{suffix}"
         if candidate not in seen:
+            if counters is not None:
+                counters[name] = counter + 1
             return candidate
         counter += 1
@@ -14,3 +14,5 @@ class StickerAsset:
     file_name: str
     content: bytes
     is_animated: bool = False
+    # 所属表情包名称（Telegram set_name），用于同包贴纸复用 GIF 调色板
+    pack_name: str | None = None
@@ -9,7 +9,13 @@ class MediaNormalizer(Protocol):
 
 
 class TargetPlatformSender(Protocol):
-    async def send(
-        self, asset: StickerAsset, target_mode: Literal["bot", "webhook"], target: str
+    async def prepare(self) -> None:
+        """发送前的准备工作（如预取鉴权凭据），可与素材归一化并行执行。"""
+
+    async def upload(self, asset: StickerAsset) -> str:
+        """上传素材，返回目标平台的媒体 key。"""
+
+    async def send_uploaded(
+        self, media_key: str, target_mode: Literal["bot", "webhook"], target: str
     ) -> None:
-        """将素材发送到目标平台。"""
+        """将已上传的素材发送到目标。"""
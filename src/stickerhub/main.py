@@ -1,4 +1,6 @@
 import asyncio
+import hashlib
+import json
 import logging
 from typing import Any
 
@@ -85,7 +87,7 @@ async def async_main() -> None:
 
     telegram_app = build_telegram_application(
         token=settings.telegram_bot_api_token,
-        on_asset=relay_use_case.relay,
+        on_asset=relay_use_case.prepare,
         on_bind=lambda user_id, arg: binding_service.handle_bind_command("telegram", user_id, arg),
         on_bind_webhook=lambda user_id, url: binding_service.handle_bind_webhook(
             "telegram", user_id, url
@@ -95,7 +97,7 @@ async def async_main() -> None:
         feishu_enabled=feishu_enabled,
     )
 
-    tasks: list[Any] = [_run_telegram_polling(telegram_app, feishu_enabled)]
+    tasks: list[Any] = [_run_telegram_polling(telegram_app, binding_service, feishu_enabled)]
 
     if feishu_enabled:
         feishu_receiver = FeishuLongConnectionReceiver(
@@ -111,7 +113,12 @@ async def async_main() -> None:
     else:
         logger.info("StickerHub 启动成功（仅 Telegram 模式，飞书未配置）")
 
-    await asyncio.gather(*tasks)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if feishu_sender:
+            await feishu_sender.close()
+        await binding_service.close()
 
 
 def main() -> None:
@@ -121,10 +128,14 @@ def main() -> None:
         logging.getLogger(__name__).info("收到中断信号，StickerHub 正在退出")
 
 
-async def _run_telegram_polling(application: Any, feishu_enabled: bool = True) -> None:
+async def _run_telegram_polling(
+    application: Any,
+    binding_service: BindingService,
+    feishu_enabled: bool = True,
+) -> None:
     await application.initialize()
     await application.start()
-    await _register_telegram_commands(application, feishu_enabled)
+    await _register_telegram_commands(application, binding_service, feishu_enabled)
     await application.updater.start_polling(drop_pending_updates=True)
 
     try:
@@ -137,13 +148,25 @@ async def _run_telegram_polling(application: Any, feishu_enabled: bool = True) -
 
 async def _register_telegram_commands(
     application: Any,
+    binding_service: BindingService,
     feishu_enabled: bool = True,
 ) -> None:
     logger = logging.getLogger(__name__)
     try:
         commands = get_telegram_bot_commands(feishu_enabled)
-        await application.bot.set_my_commands(commands)
         cmd_names = ", ".join(f"/{c.command}" for c in commands)
+        # 命令列表未变化时跳过 set_my_commands，省去每次启动的一次 Telegram API 往返。
+        # 摘要按 bot id 区分，更换 Token 后会重新注册。
+        digest = hashlib.sha1(
+            json.dumps([(c.command, c.description) for c in commands]).encode("utf-8")
+        ).hexdigest()
+        meta_key = f"tg_commands_digest:{application.bot.id}"
+        if await binding_service.get_meta(meta_key) == digest:
+            logger.info("Telegram 命令未变化，跳过注册: %s", cmd_names)
+            return
+
+        await application.bot.set_my_commands(commands)
+        await binding_service.set_meta(meta_key, digest)
         logger.info("Telegram 命令已注册: %s", cmd_names)
     except Exception:  # noqa: BLE001
         logger.exception("Telegram 命令注册失败")
@@ -4,9 +4,12 @@ import secrets
 import sqlite3
 import time
 import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal
 from urllib.parse import urlparse
 
 from stickerhub.utils.url_masking import mask_url
@@ -20,88 +23,353 @@ class FeishuTarget:
     target: str
 
 
+# 未设置 row_factory，查询结果是按列序号读取的普通 tuple
+_Row = tuple[Any, ...]
+
+# 连接级 PRAGMA 不会持久化到数据库文件，每个新连接都需要重新设置；
+# 可通过 BindingStore(pragmas=...) 覆盖或追加
+_CONNECTION_PRAGMAS: dict[str, str | int] = {
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64000,
+}
+_FILE_CONNECTION_PRAGMAS = ("PRAGMA mmap_size=268435456",)
+# 等待其他进程释放写锁的上限（即 busy_timeout）
+_BUSY_TIMEOUT_SECONDS = 5.0
+# 每个连接缓存的已编译语句数，需覆盖下方全部 SQL 常量与 PRAGMA
+_CACHED_STATEMENTS = 256
+
+# SQL 统一定义为模块级常量：sqlite3 在每个连接上按 SQL 文本缓存已编译的语句，
+# 常驻连接配合固定文本即可复用编译结果，省去每次调用的解析与代码生成。
+_SQL_SELECT_HUB_ID = """
+SELECT hub_id
+FROM platform_bindings
+WHERE platform = ? AND platform_user_id = ?
+"""
+
+_SQL_RESOLVE_TARGET = """
+SELECT s.hub_id, t.platform_user_id
+FROM platform_bindings s
+LEFT JOIN platform_bindings t
+    ON t.platform = ? AND t.hub_id = s.hub_id
+WHERE s.platform = ? AND s.platform_user_id = ?
+ORDER BY t.updated_at DESC
+LIMIT 1
+"""
+
+_SQL_RESOLVE_FEISHU_TARGET = """
+SELECT
+    s.hub_id,
+    w.webhook_url,
+    (
+        SELECT f.platform_user_id
+        FROM platform_bindings f
+        WHERE f.platform = 'feishu' AND f.hub_id = s.hub_id
+        ORDER BY f.updated_at DESC
+        LIMIT 1
+    ) AS open_id
+FROM platform_bindings s
+LEFT JOIN feishu_webhook_bindings w
+    ON w.hub_id = s.hub_id
+WHERE s.platform = ? AND s.platform_user_id = ?
+"""
+
+_SQL_UPSERT_PLATFORM_BINDING = """
+INSERT INTO platform_bindings(
+    platform, platform_user_id, hub_id, created_at, updated_at
+)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(platform, platform_user_id)
+DO UPDATE SET
+    hub_id = excluded.hub_id,
+    updated_at = excluded.updated_at
+"""
+
+_SQL_DELETE_OTHER_HUB_BINDINGS = """
+DELETE FROM platform_bindings
+WHERE platform = ? AND hub_id = ? AND platform_user_id != ?
+RETURNING platform_user_id
+"""
+
+_SQL_INSERT_MAGIC_CODE = """
+INSERT INTO magic_codes(code, hub_id, expires_at, used, created_at)
+VALUES (?, ?, ?, 0, ?)
+"""
+
+_SQL_PURGE_MAGIC_CODES = """
+DELETE FROM magic_codes
+WHERE used = 1 OR expires_at < ?
+"""
+
+_SQL_SELECT_MAGIC_CODE = """
+SELECT used
+FROM magic_codes
+WHERE code = ?
+"""
+
+_SQL_CONSUME_MAGIC_CODE = """
+UPDATE magic_codes
+SET used = 1, used_at = ?
+WHERE code = ? AND used = 0 AND expires_at >= ?
+RETURNING hub_id
+"""
+
+_SQL_SELECT_PLATFORM_USER_ID = """
+SELECT platform_user_id
+FROM platform_bindings
+WHERE platform = ? AND hub_id = ?
+ORDER BY updated_at DESC
+LIMIT 1
+"""
+
+_SQL_SELECT_FEISHU_WEBHOOK = """
+SELECT webhook_url
+FROM feishu_webhook_bindings
+WHERE hub_id = ?
+"""
+
+_SQL_DELETE_FEISHU_BINDINGS = """
+DELETE FROM platform_bindings
+WHERE platform = 'feishu' AND hub_id = ?
+RETURNING platform_user_id
+"""
+
+_SQL_UPSERT_FEISHU_WEBHOOK = """
+INSERT INTO feishu_webhook_bindings(
+    hub_id, webhook_url, created_at, updated_at
+)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(hub_id)
+DO UPDATE SET
+    webhook_url = excluded.webhook_url,
+    updated_at = excluded.updated_at
+"""
+
+_SQL_DELETE_FEISHU_WEBHOOK = """
+DELETE FROM feishu_webhook_bindings
+WHERE hub_id = ?
+"""
+
+_SQL_SELECT_META = """
+SELECT value
+FROM kv_meta
+WHERE key = ?
+"""
+
+_SQL_UPSERT_META = """
+INSERT INTO kv_meta(key, value, updated_at)
+VALUES (?, ?, ?)
+ON CONFLICT(key)
+DO UPDATE SET
+    value = excluded.value,
+    updated_at = excluded.updated_at
+"""
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS platform_bindings (
+    platform TEXT NOT NULL,
+    platform_user_id TEXT NOT NULL,
+    hub_id TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (platform, platform_user_id)
+);
+
+-- 覆盖索引：按 (platform, hub_id) 取最新绑定时无需回表
+CREATE INDEX IF NOT EXISTS idx_platform_bindings_hub_cover
+ON platform_bindings (platform, hub_id, updated_at DESC, platform_user_id);
+
+DROP INDEX IF EXISTS idx_platform_bindings_hub;
+
+CREATE TABLE IF NOT EXISTS magic_codes (
+    code TEXT PRIMARY KEY,
+    hub_id TEXT NOT NULL,
+    expires_at INTEGER NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER NOT NULL,
+    used_at INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_magic_codes_expires
+ON magic_codes (expires_at);
+
+CREATE TABLE IF NOT EXISTS feishu_webhook_bindings (
+    hub_id TEXT PRIMARY KEY,
+    webhook_url TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS kv_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+_FEISHU_WEBHOOK_PATH_MARKER = "/open-apis/bot/v2/hook/"
+
+# 累计清理这么多条魔法字符串后执行一次 incremental_vacuum，归还空闲页
+_MAGIC_CODE_VACUUM_THRESHOLD = 256
+
+_LOOKUP_CACHE_MAXSIZE = 10_000
+_LOOKUP_CACHE_TTL_SECONDS = 300.0
+
+
+class _TtlCache[K: Hashable, V]:
+    """带容量上限与过期时间的 LRU 缓存，值可以是 None（用于缓存“未绑定”的查询结果）。"""
+
+    def __init__(self, maxsize: int, ttl_seconds: float) -> None:
+        self._maxsize = maxsize
+        self._ttl_seconds = ttl_seconds
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> tuple[bool, V | None]:
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = (time.monotonic() + self._ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+
 class BindingStore:
-    def __init__(self, db_path: str) -> None:
-        self._db_path = Path(db_path)
+    """
+    SQLite 绑定存储。
+
+    初始化后常驻一条写连接与若干读连接。sqlite3 是阻塞 API，所有语句都在线程池中执行，
+    避免磁盘 I/O 阻塞事件循环：写操作固定在单线程执行器上串行执行（SQLite 单写者），
+    读操作从读连接池借用连接，借助 WAL 与写操作并发执行。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        reader_pool_size: int = 4,
+        pragmas: Mapping[str, str | int] | None = None,
+    ) -> None:
+        self._db_path = db_path
+        # file: 开头的路径按 SQLite URI 打开，例如 file:name?mode=memory&cache=shared
+        self._uri = db_path.startswith("file:")
+        self._pragmas = {**_CONNECTION_PRAGMAS, **(pragmas or {})}
+        for name in self._pragmas:
+            if not name.isidentifier():
+                raise ValueError(f"非法的 PRAGMA 名称: {name!r}")
+        # 是否为内存数据库在初始化时由 SQLite 判定，见 _initialize_sync
+        self._in_memory = False
+        self._reader_pool_size = reader_pool_size
+        # 仅保护连接的打开与关闭；读写语句的并发由 WAL 与写执行器保证
         self._lock = asyncio.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._closed = False
+        self._readers: asyncio.Queue[sqlite3.Connection] = asyncio.Queue()
+        self._reader_conns: list[sqlite3.Connection] = []
+        self._writer_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="binding-writer",
+        )
+        self._reader_executor = ThreadPoolExecutor(
+            max_workers=max(self._reader_pool_size, 1),
+            thread_name_prefix="binding-reader",
+        )
+        # 绑定关系相对消息量极少变化，热点查询走进程内缓存，写操作按 key 精确失效。
+        # (platform, platform_user_id) -> hub_id
+        self._hub_cache: _TtlCache[tuple[str, str], str | None] = _TtlCache(
+            _LOOKUP_CACHE_MAXSIZE, _LOOKUP_CACHE_TTL_SECONDS
+        )
+        # (platform, hub_id) -> platform_user_id
+        self._user_cache: _TtlCache[tuple[str, str], str | None] = _TtlCache(
+            _LOOKUP_CACHE_MAXSIZE, _LOOKUP_CACHE_TTL_SECONDS
+        )
+        # hub_id -> webhook_url
+        self._webhook_cache: _TtlCache[str, str | None] = _TtlCache(
+            _LOOKUP_CACHE_MAXSIZE, _LOOKUP_CACHE_TTL_SECONDS
+        )
+        # 每次失效递增；查询期间若发生过失效，则不回填可能已过期的结果
+        self._cache_generation = 0
+        # 仅在写线程中读写
+        self._purged_since_vacuum = 0
 
     async def ensure_initialized(self) -> None:
         async with self._lock:
-            self._db_path.parent.mkdir(parents=True, exist_ok=True)
-            with self._connect() as conn:
-                conn.executescript(
-                    """
-                    CREATE TABLE IF NOT EXISTS platform_bindings (
-                        platform TEXT NOT NULL,
-                        platform_user_id TEXT NOT NULL,
-                        hub_id TEXT NOT NULL,
-                        created_at INTEGER NOT NULL,
-                        updated_at INTEGER NOT NULL,
-                        PRIMARY KEY (platform, platform_user_id)
-                    );
-
-                    CREATE INDEX IF NOT EXISTS idx_platform_bindings_hub
-                    ON platform_bindings (platform, hub_id);
-
-                    CREATE TABLE IF NOT EXISTS magic_codes (
-                        code TEXT PRIMARY KEY,
-                        hub_id TEXT NOT NULL,
-                        expires_at INTEGER NOT NULL,
-                        used INTEGER NOT NULL DEFAULT 0,
-                        created_at INTEGER NOT NULL,
-                        used_at INTEGER
-                    );
-
-                    CREATE TABLE IF NOT EXISTS feishu_webhook_bindings (
-                        hub_id TEXT PRIMARY KEY,
-                        webhook_url TEXT NOT NULL,
-                        created_at INTEGER NOT NULL,
-                        updated_at INTEGER NOT NULL
-                    );
-                    """
-                )
-                conn.commit()
+            # 关闭时执行器已停止，无法再提交任务，需新建 BindingStore
+            if self._closed:
+                raise RuntimeError("绑定数据库已关闭")
+            # 连接池在进程内长期复用，重复初始化直接返回，避免泄漏已打开的连接
+            if self._writer is not None:
+                return
+            await asyncio.get_running_loop().run_in_executor(
+                self._writer_executor, self._initialize_sync
+            )
+            for reader in self._reader_conns:
+                self._readers.put_nowait(reader)
 
-            logger.info("绑定数据库已初始化: %s", self._db_path)
+        logger.info("绑定数据库已初始化: %s", self._db_path)
 
-    async def get_hub_id(self, platform: str, platform_user_id: str) -> str | None:
+    async def close(self) -> None:
         async with self._lock:
-            with self._connect() as conn:
-                row = conn.execute(
-                    """
-                    SELECT hub_id
-                    FROM platform_bindings
-                    WHERE platform = ? AND platform_user_id = ?
-                    """,
-                    (platform, platform_user_id),
-                ).fetchone()
+            self._closed = True
+            # 先等执行器中已提交的读写完成，再关闭连接，避免关闭仍在其他线程中使用的连接
+            await asyncio.to_thread(self._shutdown_executors)
+            for reader in self._reader_conns:
+                reader.close()
+            self._reader_conns.clear()
+            self._readers = asyncio.Queue()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _shutdown_executors(self) -> None:
+        self._writer_executor.shutdown(wait=True)
+        self._reader_executor.shutdown(wait=True)
 
-        return str(row["hub_id"]) if row else None
+    async def get_hub_id(self, platform: str, platform_user_id: str) -> str | None:
+        key = (platform, platform_user_id)
+        hit, cached = self._hub_cache.get(key)
+        if hit:
+            return cached
+
+        generation = self._cache_generation
+        row = await self._fetchone(_SQL_SELECT_HUB_ID, (platform, platform_user_id))
+        hub_id = str(row[0]) if row else None
+        if generation == self._cache_generation:
+            self._hub_cache.set(key, hub_id)
+        return hub_id
 
     async def bind_platform(
         self,
         platform: str,
         platform_user_id: str,
         hub_id: str,
+        now: int | None = None,
     ) -> None:
-        now = int(time.time())
-        async with self._lock:
-            with self._connect() as conn:
+        now = _unix_now() if now is None else now
+
+        def _bind(conn: sqlite3.Connection) -> str | None:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                current_row = conn.execute(
+                    _SQL_SELECT_HUB_ID, (platform, platform_user_id)
+                ).fetchone()
                 conn.execute(
-                    """
-                    INSERT INTO platform_bindings(
-                        platform, platform_user_id, hub_id, created_at, updated_at
-                    )
-                    VALUES (?, ?, ?, ?, ?)
-                    ON CONFLICT(platform, platform_user_id)
-                    DO UPDATE SET
-                        hub_id = excluded.hub_id,
-                        updated_at = excluded.updated_at
-                    """,
-                    (platform, platform_user_id, hub_id, now, now),
+                    _SQL_UPSERT_PLATFORM_BINDING, (platform, platform_user_id, hub_id, now, now)
                 )
-                conn.commit()
+            return str(current_row[0]) if current_row else None
 
+        previous_hub_id = await self._run_write(_bind)
+        self._invalidate_platform_binding(platform, [platform_user_id], [hub_id, previous_hub_id])
         logger.info("绑定平台身份成功: platform=%s user=%s", platform, platform_user_id)
 
     async def force_bind_platform(
@@ -109,59 +377,26 @@ class BindingStore:
         platform: str,
         platform_user_id: str,
         hub_id: str,
+        now: int | None = None,
     ) -> dict[str, str | None]:
         """
         强制绑定策略（用于消费魔法字符串）：
         1. 当前账号总是绑定到目标 hub_id
         2. 若同平台已有其他账号绑定到该 hub_id，旧账号会被替换（魔法字符串所属身份优先）
         """
-        now = int(time.time())
-        async with self._lock:
-            with self._connect() as conn:
-                current_row = conn.execute(
-                    """
-                    SELECT hub_id
-                    FROM platform_bindings
-                    WHERE platform = ? AND platform_user_id = ?
-                    """,
-                    (platform, platform_user_id),
-                ).fetchone()
-                previous_hub_id = str(current_row["hub_id"]) if current_row else None
-
-                replaced_row = conn.execute(
-                    """
-                    SELECT platform_user_id
-                    FROM platform_bindings
-                    WHERE platform = ? AND hub_id = ? AND platform_user_id != ?
-                    LIMIT 1
-                    """,
-                    (platform, hub_id, platform_user_id),
-                ).fetchone()
-                replaced_user_id = str(replaced_row["platform_user_id"]) if replaced_row else None
+        now = _unix_now() if now is None else now
 
-                conn.execute(
-                    """
-                    DELETE FROM platform_bindings
-                    WHERE platform = ? AND hub_id = ? AND platform_user_id != ?
-                    """,
-                    (platform, hub_id, platform_user_id),
-                )
-
-                conn.execute(
-                    """
-                    INSERT INTO platform_bindings(
-                        platform, platform_user_id, hub_id, created_at, updated_at
-                    )
-                    VALUES (?, ?, ?, ?, ?)
-                    ON CONFLICT(platform, platform_user_id)
-                    DO UPDATE SET
-                        hub_id = excluded.hub_id,
-                        updated_at = excluded.updated_at
-                    """,
-                    (platform, platform_user_id, hub_id, now, now),
-                )
-                conn.commit()
+        def _force_bind(conn: sqlite3.Connection) -> tuple[str | None, list[str]]:
+            with conn:
+                # 先读后写的事务直接申请写锁，避免读事务升级写事务时与其他写者冲突
+                conn.execute("BEGIN IMMEDIATE")
+                return _force_bind_sync(conn, platform, platform_user_id, hub_id, now)
 
+        previous_hub_id, replaced_user_ids = await self._run_write(_force_bind)
+        self._invalidate_platform_binding(
+            platform, [platform_user_id, *replaced_user_ids], [hub_id, previous_hub_id]
+        )
+        replaced_user_id = replaced_user_ids[0] if replaced_user_ids else None
         logger.info(
             "强制绑定完成: platform=%s user=%s previous_hub=%s replaced_user=%s",
             platform,
@@ -174,135 +409,202 @@ class BindingStore:
             "replaced_user_id": replaced_user_id,
         }
 
-    async def create_magic_code(self, hub_id: str, ttl_seconds: int) -> str:
-        now = int(time.time())
+    async def create_magic_code(self, hub_id: str, ttl_seconds: int, now: int | None = None) -> str:
+        now = _unix_now() if now is None else now
         expires_at = now + ttl_seconds
 
-        async with self._lock:
-            with self._connect() as conn:
-                for _ in range(10):
-                    code = secrets.token_hex(4).upper()
-                    try:
-                        conn.execute(
-                            """
-                            INSERT INTO magic_codes(code, hub_id, expires_at, used, created_at)
-                            VALUES (?, ?, ?, 0, ?)
-                            """,
-                            (code, hub_id, expires_at, now),
-                        )
-                        conn.commit()
-                        logger.info(
-                            "创建魔法字符串成功: hub_id=%s expires_at=%s",
-                            hub_id,
-                            expires_at,
-                        )
-                        return code
-                    except sqlite3.IntegrityError:
-                        continue
-
-        raise RuntimeError("生成魔法字符串失败，请重试")
-
-    async def consume_magic_code(self, code: str) -> tuple[bool, str | None, str]:
-        normalized = code.strip().upper()
-        now = int(time.time())
+        def _create(conn: sqlite3.Connection) -> str | None:
+            # 顺带清理已使用/已过期的记录，避免表和主键索引无限增长
+            purged = conn.execute(_SQL_PURGE_MAGIC_CODES, (now,)).rowcount
+            self._maybe_incremental_vacuum(conn, purged)
+
+            # 48 位熵下碰撞几乎不可能，只在极罕见的冲突时重新生成一次
+            for _ in range(2):
+                code = secrets.token_hex(6).upper()
+                try:
+                    conn.execute(_SQL_INSERT_MAGIC_CODE, (code, hub_id, expires_at, now))
+                    return code
+                except sqlite3.IntegrityError:
+                    continue
+            return None
 
-        async with self._lock:
-            with self._connect() as conn:
-                row = conn.execute(
-                    """
-                    SELECT hub_id, expires_at, used
-                    FROM magic_codes
-                    WHERE code = ?
-                    """,
-                    (normalized,),
-                ).fetchone()
+        code = await self._run_write(_create)
+        if code is None:
+            raise RuntimeError("生成魔法字符串失败，请重试")
 
-                if not row:
-                    return False, None, "魔法字符串无效"
+        logger.info("创建魔法字符串成功: hub_id=%s expires_at=%s", hub_id, expires_at)
+        return code
 
-                if int(row["used"]) == 1:
-                    return False, None, "魔法字符串已被使用"
+    async def consume_magic_code(
+        self, code: str, now: int | None = None
+    ) -> tuple[bool, str | None, str]:
+        normalized = code.strip().upper()
+        now = _unix_now() if now is None else now
 
-                if int(row["expires_at"]) < now:
-                    return False, None, "魔法字符串已过期"
+        def _consume(conn: sqlite3.Connection) -> tuple[bool, str | None, str]:
+            return _consume_magic_code_sync(conn, normalized, now)
 
-                conn.execute(
-                    """
-                    UPDATE magic_codes
-                    SET used = 1, used_at = ?
-                    WHERE code = ?
-                    """,
-                    (now, normalized),
+        result = await self._run_write(_consume)
+        if result[0]:
+            logger.info("消费魔法字符串成功: code=%s", normalized)
+        return result
+
+    async def redeem_magic_code(
+        self,
+        code: str,
+        platform: str,
+        platform_user_id: str,
+        clear_feishu_webhook: bool = False,
+        now: int | None = None,
+    ) -> tuple[bool, str | None, str, dict[str, str | None]]:
+        """
+        在同一个事务内核销魔法字符串并强制绑定当前账号（策略同 force_bind_platform），
+        clear_feishu_webhook 为 True 时一并清理该 hub 的飞书 webhook；
+        核销失败时不做任何修改，返回 (False, None, 原因, {})。
+        """
+        normalized = code.strip().upper()
+        now = _unix_now() if now is None else now
+
+        def _redeem(
+            conn: sqlite3.Connection,
+        ) -> tuple[bool, str | None, str, str | None, list[str], bool]:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                ok, hub_id, reason = _consume_magic_code_sync(conn, normalized, now)
+                if not ok or not hub_id:
+                    return False, None, reason, None, [], False
+
+                previous_hub_id, replaced_user_ids = _force_bind_sync(
+                    conn, platform, platform_user_id, hub_id, now
+                )
+                webhook_cleared = (
+                    clear_feishu_webhook
+                    and conn.execute(_SQL_DELETE_FEISHU_WEBHOOK, (hub_id,)).rowcount > 0
                 )
-                conn.commit()
+            return True, hub_id, reason, previous_hub_id, replaced_user_ids, webhook_cleared
 
-        logger.info("消费魔法字符串成功: code=%s", normalized)
-        return True, str(row["hub_id"]), "ok"
+        ok, hub_id, reason, previous_hub_id, replaced_user_ids, webhook_cleared = (
+            await self._run_write(_redeem)
+        )
+        if not ok or not hub_id:
+            return False, None, reason, {}
+
+        self._invalidate_platform_binding(
+            platform, [platform_user_id, *replaced_user_ids], [hub_id, previous_hub_id]
+        )
+        if clear_feishu_webhook:
+            self._invalidate_webhook(hub_id)
+        replaced_user_id = replaced_user_ids[0] if replaced_user_ids else None
+        logger.info(
+            "核销魔法字符串并绑定完成: code=%s platform=%s user=%s previous_hub=%s "
+            "replaced_user=%s webhook_cleared=%s",
+            normalized,
+            platform,
+            platform_user_id,
+            previous_hub_id,
+            replaced_user_id,
+            webhook_cleared,
+        )
+        return (
+            True,
+            hub_id,
+            reason,
+            {"previous_hub_id": previous_hub_id, "replaced_user_id": replaced_user_id},
+        )
 
     async def get_platform_user_id(self, platform: str, hub_id: str) -> str | None:
-        async with self._lock:
-            with self._connect() as conn:
-                row = conn.execute(
-                    """
-                    SELECT platform_user_id
-                    FROM platform_bindings
-                    WHERE platform = ? AND hub_id = ?
-                    ORDER BY updated_at DESC
-                    LIMIT 1
-                    """,
-                    (platform, hub_id),
-                ).fetchone()
+        key = (platform, hub_id)
+        hit, cached = self._user_cache.get(key)
+        if hit:
+            return cached
+
+        generation = self._cache_generation
+        row = await self._fetchone(_SQL_SELECT_PLATFORM_USER_ID, (platform, hub_id))
+        platform_user_id = str(row[0]) if row else None
+        if generation == self._cache_generation:
+            self._user_cache.set(key, platform_user_id)
+        return platform_user_id
+
+    async def resolve_target(
+        self,
+        source_platform: str,
+        source_user_id: str,
+        target_platform: str,
+    ) -> tuple[str | None, str | None]:
+        """一次查询同时解析源身份的 hub_id 与目标平台用户，返回 (hub_id, target_user_id)。"""
+        hub_key = (source_platform, source_user_id)
+        hit, hub_id = self._hub_cache.get(hub_key)
+        if hit:
+            if hub_id is None:
+                return None, None
+            hit, target_user_id = self._user_cache.get((target_platform, hub_id))
+            if hit:
+                return hub_id, target_user_id
+
+        generation = self._cache_generation
+        row = await self._fetchone(
+            _SQL_RESOLVE_TARGET, (target_platform, source_platform, source_user_id)
+        )
+        hub_id, target_user_id = row if row else (None, None)
+        if generation == self._cache_generation:
+            self._hub_cache.set(hub_key, hub_id)
+            if hub_id is not None:
+                self._user_cache.set((target_platform, hub_id), target_user_id)
+        return hub_id, target_user_id
+
+    async def resolve_feishu_target(
+        self,
+        source_platform: str,
+        source_user_id: str,
+    ) -> tuple[str | None, str | None, str | None]:
+        """一次查询解析源身份的飞书投递目标，返回 (hub_id, webhook_url, open_id)。"""
+        hub_key = (source_platform, source_user_id)
+        hit, hub_id = self._hub_cache.get(hub_key)
+        if hit:
+            if hub_id is None:
+                return None, None, None
+            webhook_hit, webhook_url = self._webhook_cache.get(hub_id)
+            open_id_hit, open_id = self._user_cache.get(("feishu", hub_id))
+            if webhook_hit and open_id_hit:
+                return hub_id, webhook_url, open_id
+
+        generation = self._cache_generation
+        row = await self._fetchone(_SQL_RESOLVE_FEISHU_TARGET, (source_platform, source_user_id))
+        if not row:
+            if generation == self._cache_generation:
+                self._hub_cache.set(hub_key, None)
+            return None, None, None
+
+        hub_id, webhook_url, open_id = row
+        if generation == self._cache_generation:
+            self._hub_cache.set(hub_key, hub_id)
+            self._webhook_cache.set(hub_id, webhook_url)
+            self._user_cache.set(("feishu", hub_id), open_id)
+        return hub_id, webhook_url, open_id
+
+    async def bind_feishu_webhook(
+        self, hub_id: str, webhook_url: str, now: int | None = None
+    ) -> dict[str, str | None]:
+        now = _unix_now() if now is None else now
 
-        return str(row["platform_user_id"]) if row else None
+        def _bind_webhook(conn: sqlite3.Connection) -> tuple[str | None, list[str]]:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                webhook_row = conn.execute(_SQL_SELECT_FEISHU_WEBHOOK, (hub_id,)).fetchone()
 
-    async def bind_feishu_webhook(self, hub_id: str, webhook_url: str) -> dict[str, str | None]:
-        now = int(time.time())
-        async with self._lock:
-            with self._connect() as conn:
-                webhook_row = conn.execute(
-                    """
-                    SELECT webhook_url
-                    FROM feishu_webhook_bindings
-                    WHERE hub_id = ?
-                    """,
-                    (hub_id,),
-                ).fetchone()
-                previous_webhook = str(webhook_row["webhook_url"]) if webhook_row else None
-
-                replaced_row = conn.execute(
-                    """
-                    SELECT platform_user_id
-                    FROM platform_bindings
-                    WHERE platform = 'feishu' AND hub_id = ?
-                    LIMIT 1
-                    """,
-                    (hub_id,),
-                ).fetchone()
-                replaced_user_id = str(replaced_row["platform_user_id"]) if replaced_row else None
+                replaced_rows = conn.execute(_SQL_DELETE_FEISHU_BINDINGS, (hub_id,)).fetchall()
 
-                conn.execute(
-                    """
-                    DELETE FROM platform_bindings
-                    WHERE platform = 'feishu' AND hub_id = ?
-                    """,
-                    (hub_id,),
-                )
+                conn.execute(_SQL_UPSERT_FEISHU_WEBHOOK, (hub_id, webhook_url, now, now))
 
-                conn.execute(
-                    """
-                    INSERT INTO feishu_webhook_bindings(
-                        hub_id, webhook_url, created_at, updated_at
-                    )
-                    VALUES (?, ?, ?, ?)
-                    ON CONFLICT(hub_id)
-                    DO UPDATE SET
-                        webhook_url = excluded.webhook_url,
-                        updated_at = excluded.updated_at
-                    """,
-                    (hub_id, webhook_url, now, now),
-                )
-                conn.commit()
+            return (
+                str(webhook_row[0]) if webhook_row else None,
+                [str(user_id) for (user_id,) in replaced_rows],
+            )
 
+        previous_webhook, replaced_user_ids = await self._run_write(_bind_webhook)
+        self._invalidate_platform_binding("feishu", replaced_user_ids, [hub_id])
+        self._invalidate_webhook(hub_id)
+        replaced_user_id = replaced_user_ids[0] if replaced_user_ids else None
         logger.info("飞书 webhook 绑定成功: hub_id=%s replaced_user=%s", hub_id, replaced_user_id)
         return {
             "previous_webhook": previous_webhook,
@@ -310,41 +612,175 @@ class BindingStore:
         }
 
     async def clear_feishu_webhook(self, hub_id: str) -> bool:
-        async with self._lock:
-            with self._connect() as conn:
-                cursor = conn.execute(
-                    """
-                    DELETE FROM feishu_webhook_bindings
-                    WHERE hub_id = ?
-                    """,
-                    (hub_id,),
-                )
-                conn.commit()
-                deleted = cursor.rowcount > 0
+        def _clear(conn: sqlite3.Connection) -> bool:
+            return conn.execute(_SQL_DELETE_FEISHU_WEBHOOK, (hub_id,)).rowcount > 0
 
+        deleted = await self._run_write(_clear)
+        self._invalidate_webhook(hub_id)
         if deleted:
             logger.info("已清理飞书 webhook 绑定: hub_id=%s", hub_id)
         return deleted
 
     async def get_feishu_webhook(self, hub_id: str) -> str | None:
-        async with self._lock:
-            with self._connect() as conn:
-                row = conn.execute(
-                    """
-                    SELECT webhook_url
-                    FROM feishu_webhook_bindings
-                    WHERE hub_id = ?
-                    """,
-                    (hub_id,),
-                ).fetchone()
-        return str(row["webhook_url"]) if row else None
+        hit, cached = self._webhook_cache.get(hub_id)
+        if hit:
+            return cached
+
+        generation = self._cache_generation
+        row = await self._fetchone(_SQL_SELECT_FEISHU_WEBHOOK, (hub_id,))
+        webhook_url = str(row[0]) if row else None
+        if generation == self._cache_generation:
+            self._webhook_cache.set(hub_id, webhook_url)
+        return webhook_url
+
+    async def get_meta(self, key: str) -> str | None:
+        row = await self._fetchone(_SQL_SELECT_META, (key,))
+        return str(row[0]) if row else None
+
+    async def set_meta(self, key: str, value: str) -> None:
+        now = _unix_now()
+
+        def _set(conn: sqlite3.Connection) -> None:
+            conn.execute(_SQL_UPSERT_META, (key, value, now))
+
+        await self._run_write(_set)
+
+    def _invalidate_platform_binding(
+        self,
+        platform: str,
+        platform_user_ids: list[str],
+        hub_ids: list[str | None],
+    ) -> None:
+        self._cache_generation += 1
+        for platform_user_id in platform_user_ids:
+            self._hub_cache.pop((platform, platform_user_id))
+        for hub_id in hub_ids:
+            if hub_id:
+                self._user_cache.pop((platform, hub_id))
+
+    def _invalidate_webhook(self, hub_id: str) -> None:
+        self._cache_generation += 1
+        self._webhook_cache.pop(hub_id)
+
+    async def _fetchone(self, sql: str, params: tuple[object, ...]) -> _Row | None:
+        # 关闭后读连接队列为空，先检查以免永久等待
+        self._require_writer()
+        if not self._reader_pool_size:
+            return await self._run_write(lambda conn: conn.execute(sql, params).fetchone())
+
+        # close() 会替换读连接队列，归还时须放回借出时的队列，否则其余等待者永远拿不到连接
+        readers = self._readers
+        conn = await readers.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._reader_executor, _fetchone, conn, sql, params
+            )
+        finally:
+            readers.put_nowait(conn)
+
+    async def _run_write[T](self, func: Callable[[sqlite3.Connection], T]) -> T:
+        # 单线程执行器本身保证写连接上的事务串行，无需再持有 asyncio 锁
+        conn = self._require_writer()
+        return await asyncio.get_running_loop().run_in_executor(self._writer_executor, func, conn)
+
+    def _maybe_incremental_vacuum(self, conn: sqlite3.Connection, purged: int) -> None:
+        self._purged_since_vacuum += purged
+        if self._in_memory or self._purged_since_vacuum < _MAGIC_CODE_VACUUM_THRESHOLD:
+            return
+        self._purged_since_vacuum = 0
+        # incremental_vacuum 不能在事务内执行，且每次 step 只释放一页，需要 fetchall 跑完
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    def _require_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            raise RuntimeError("绑定数据库尚未初始化")
+        return self._writer
+
+    def _initialize_sync(self) -> None:
+        if not self._uri and self._db_path != ":memory:":
+            Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._writer = self._connect()
+        # 内存库有 :memory:、file::memory:、mode=memory 等多种写法，直接询问 SQLite
+        # 主库是否有对应文件，比解析路径字符串可靠
+        self._in_memory = not conn.execute("PRAGMA database_list").fetchone()[2]
+        if self._in_memory:
+            # 内存数据库不支持 WAL，多连接共享缓存时读写会互相加表锁；
+            # 非共享缓存时每个新连接都是一个独立的空库。读操作直接复用写连接
+            self._reader_pool_size = 0
+        else:
+            for pragma in _FILE_CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            # WAL 让读写互不阻塞，并把每次写入的 fsync 从两次降为一次；
+            # auto_vacuum 仅对新建数据库生效，需在建表前设置
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA_SQL)
+        # 刷新统计信息，确保查询规划器选用覆盖索引
+        conn.execute("ANALYZE")
+
+        for _ in range(self._reader_pool_size):
+            reader = self._connect()
+            for pragma in _FILE_CONNECTION_PRAGMAS:
+                reader.execute(pragma)
+            self._reader_conns.append(reader)
 
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self._db_path)
-        conn.row_factory = sqlite3.Row
+        # isolation_level=None：驱动不再隐式 BEGIN（DEFERRED），单条写语句自动提交，
+        # 多语句事务一律显式 BEGIN IMMEDIATE，避免读事务升级写锁时触发 SQLITE_BUSY
+        conn = sqlite3.connect(
+            self._db_path,
+            timeout=_BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=_CACHED_STATEMENTS,
+            uri=self._uri,
+        )
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
         return conn
 
 
+def _fetchone(conn: sqlite3.Connection, sql: str, params: tuple[object, ...]) -> _Row | None:
+    row: _Row | None = conn.execute(sql, params).fetchone()
+    return row
+
+
+def _consume_magic_code_sync(
+    conn: sqlite3.Connection, code: str, now: int
+) -> tuple[bool, str | None, str]:
+    # 单条 UPDATE 原子地完成校验与核销；仅在失败时再查询具体原因
+    row = conn.execute(_SQL_CONSUME_MAGIC_CODE, (now, code, now)).fetchone()
+    if row:
+        return True, str(row[0]), "ok"
+
+    row = conn.execute(_SQL_SELECT_MAGIC_CODE, (code,)).fetchone()
+    if not row:
+        return False, None, "魔法字符串无效"
+
+    if int(row[0]) == 1:
+        return False, None, "魔法字符串已被使用"
+
+    return False, None, "魔法字符串已过期"
+
+
+def _force_bind_sync(
+    conn: sqlite3.Connection, platform: str, platform_user_id: str, hub_id: str, now: int
+) -> tuple[str | None, list[str]]:
+    """需在调用方开启的写事务内执行，返回 (原 hub_id, 被替换的同平台账号)。"""
+    current_row = conn.execute(_SQL_SELECT_HUB_ID, (platform, platform_user_id)).fetchone()
+
+    # RETURNING 直接带回被替换的账号，省去删除前的额外查询
+    replaced_rows = conn.execute(
+        _SQL_DELETE_OTHER_HUB_BINDINGS, (platform, hub_id, platform_user_id)
+    ).fetchall()
+
+    conn.execute(_SQL_UPSERT_PLATFORM_BINDING, (platform, platform_user_id, hub_id, now, now))
+    return (
+        str(current_row[0]) if current_row else None,
+        [str(user_id) for (user_id,) in replaced_rows],
+    )
+
+
 class BindingService:
     def __init__(
         self,
@@ -354,12 +790,23 @@ class BindingService:
     ) -> None:
         self._store = store
         self._magic_ttl_seconds = magic_ttl_seconds
-        # None 表示使用默认白名单，[] 表示禁用白名单，其他表示自定义白名单
-        self._webhook_allowed_hosts = webhook_allowed_hosts
+        # 空集合表示不校验域名；白名单在初始化时统一转小写，校验时只需一次哈希查找
+        self._webhook_allowed_hosts = frozenset(
+            host.lower() for host in webhook_allowed_hosts or ()
+        )
 
     async def initialize(self) -> None:
         await self._store.ensure_initialized()
 
+    async def close(self) -> None:
+        await self._store.close()
+
+    async def get_meta(self, key: str) -> str | None:
+        return await self._store.get_meta(key)
+
+    async def set_meta(self, key: str, value: str) -> None:
+        await self._store.set_meta(key, value)
+
     async def handle_bind_command(
         self,
         platform: str,
@@ -367,14 +814,16 @@ class BindingService:
         arg: str | None,
     ) -> str:
         normalized_arg = (arg or "").strip().upper()
+        # 同一次绑定流程内的多次写入共用一个时间戳
+        now = _unix_now()
 
         if not normalized_arg:
             hub_id = await self._store.get_hub_id(platform, platform_user_id)
             if not hub_id:
                 hub_id = uuid.uuid4().hex
-                await self._store.bind_platform(platform, platform_user_id, hub_id)
+                await self._store.bind_platform(platform, platform_user_id, hub_id, now=now)
 
-            code = await self._store.create_magic_code(hub_id, self._magic_ttl_seconds)
+            code = await self._store.create_magic_code(hub_id, self._magic_ttl_seconds, now=now)
             logger.info(
                 "生成绑定指令: platform=%s user=%s code=%s",
                 platform,
@@ -387,7 +836,14 @@ class BindingService:
                 f"有效期: {self._magic_ttl_seconds // 60} 分钟"
             )
 
-        ok, hub_id, reason = await self._store.consume_magic_code(normalized_arg)
+        # 核销、改绑与清理 webhook 在同一个写事务内完成，只提交一次
+        ok, hub_id, reason, details = await self._store.redeem_magic_code(
+            normalized_arg,
+            platform,
+            platform_user_id,
+            clear_feishu_webhook=platform == "feishu",
+            now=now,
+        )
         if not ok or not hub_id:
             logger.warning(
                 "绑定失败: platform=%s user=%s code=%s reason=%s",
@@ -398,9 +854,6 @@ class BindingService:
             )
             return f"绑定失败: {reason}"
 
-        details = await self._store.force_bind_platform(platform, platform_user_id, hub_id)
-        if platform == "feishu":
-            await self._store.clear_feishu_webhook(hub_id)
         logger.info(
             "绑定成功(覆盖模式): platform=%s user=%s previous_hub=%s replaced_user=%s",
             platform,
@@ -433,12 +886,13 @@ class BindingService:
                 "https://open.feishu.cn/open-apis/bot/v2/hook/xxxx"
             )
 
+        now = _unix_now()
         hub_id = await self._store.get_hub_id(source_platform, source_user_id)
         if not hub_id:
             hub_id = uuid.uuid4().hex
-            await self._store.bind_platform(source_platform, source_user_id, hub_id)
+            await self._store.bind_platform(source_platform, source_user_id, hub_id, now=now)
 
-        details = await self._store.bind_feishu_webhook(hub_id, normalized_url)
+        details = await self._store.bind_feishu_webhook(hub_id, normalized_url, now=now)
         # 脱敏 previous_webhook 避免泄露旧凭据
         previous_webhook_masked = (
             mask_url(details["previous_webhook"]) if details.get("previous_webhook") else None
@@ -461,7 +915,9 @@ class BindingService:
         source_user_id: str,
         target_platform: str,
     ) -> str | None:
-        hub_id = await self._store.get_hub_id(source_platform, source_user_id)
+        hub_id, target_user_id = await self._store.resolve_target(
+            source_platform, source_user_id, target_platform
+        )
         if not hub_id:
             logger.debug(
                 "未找到源平台绑定: source_platform=%s source_user_id=%s",
@@ -470,7 +926,6 @@ class BindingService:
             )
             return None
 
-        target_user_id = await self._store.get_platform_user_id(target_platform, hub_id)
         logger.debug(
             "绑定路由查询: source_platform=%s source_user_id=%s target_platform=%s hit=%s",
             source_platform,
@@ -485,7 +940,9 @@ class BindingService:
         source_platform: str,
         source_user_id: str,
     ) -> FeishuTarget | None:
-        hub_id = await self._store.get_hub_id(source_platform, source_user_id)
+        hub_id, webhook, open_id = await self._store.resolve_feishu_target(
+            source_platform, source_user_id
+        )
         if not hub_id:
             logger.debug(
                 "未找到源平台绑定: source_platform=%s source_user_id=%s",
@@ -494,35 +951,40 @@ class BindingService:
             )
             return None
 
-        webhook = await self._store.get_feishu_webhook(hub_id)
         if webhook:
             return FeishuTarget(mode="webhook", target=webhook)
 
-        open_id = await self._store.get_platform_user_id("feishu", hub_id)
         if open_id:
             return FeishuTarget(mode="bot", target=open_id)
 
         return None
 
 
-def _normalize_feishu_webhook_url(url: str, allowed_hosts: list[str] | None) -> str | None:
+def _unix_now() -> int:
+    """当前 Unix 时间戳（秒），用整数纳秒换算以避免浮点转换。"""
+    return time.time_ns() // 1_000_000_000
+
+
+def _normalize_feishu_webhook_url(url: str, allowed_hosts: frozenset[str]) -> str | None:
     """
     验证并归一化飞书 Webhook URL。
     - 必须是 https 协议
-    - 域名必须在白名单内（防止 SSRF），除非白名单为空列表（禁用白名单）
+    - 域名必须在白名单内（防止 SSRF），除非白名单为空（禁用白名单）
     - 路径必须包含 /open-apis/bot/v2/hook/
 
     Args:
         url: 待验证的 webhook URL
-        allowed_hosts: 域名白名单。
-            - None: 使用默认白名单 ["open.feishu.cn", "open.larksuite.com"]
-            - []: 禁用白名单校验（允许任意域名）
-            - [...]: 使用指定的自定义白名单
+        allowed_hosts: 小写域名白名单，空集合表示禁用白名单校验（允许任意域名）。
+            默认白名单由 Settings.get_webhook_allowed_hosts 提供。
     """
     normalized = url.strip()
     if not normalized:
         return None
 
+    # 廉价预检：协议前缀或路径特征不匹配的输入无需进入 urlparse
+    if normalized[:8].lower() != "https://" or _FEISHU_WEBHOOK_PATH_MARKER not in normalized:
+        return None
+
     parsed = urlparse(normalized)
     if parsed.scheme.lower() != "https":
         return None
@@ -532,12 +994,10 @@ def _normalize_feishu_webhook_url(url: str, allowed_hosts: list[str] | None) ->
         return None
 
     # 域名白名单校验（SSRF 防护）——仅基于 hostname，不限制端口
-    # allowed_hosts 为空列表或 None 时的处理在外层逻辑中已完成
-    if allowed_hosts:
-        hostname = parsed.hostname.lower()
-        if hostname not in [host.lower() for host in allowed_hosts]:
-            return None
+    # allowed_hosts 为空集合时跳过校验
+    if allowed_hosts and parsed.hostname.lower() not in allowed_hosts:
+        return None
 
-    if "/open-apis/bot/v2/hook/" not in parsed.path:
+    if _FEISHU_WEBHOOK_PATH_MARKER not in parsed.path:
         return None
     return normalized
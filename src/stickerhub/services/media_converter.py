@@ -1,21 +1,69 @@
 import asyncio
+import dataclasses
+import hashlib
+import io
 import logging
 import os
+import shutil
 import tempfile
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from functools import lru_cache, partial
 from pathlib import Path
 
+from PIL import Image
+
 from stickerhub.core.models import StickerAsset
 
 logger = logging.getLogger(__name__)
 
 # ffmpeg filter_complex：保留透明背景并生成调色板渲染 GIF。
-# 先将输入统一为 rgba、固定帧率与尺寸，再 split 为两路：
-# 一路生成带透明保留的调色板，另一路套用调色板输出 GIF。
+# 先固定帧率与尺寸，再 split 为两路：
+# 一路生成带透明保留的调色板（palettegen 自行协商 RGB 格式，alpha 随之保留），
+# 另一路转为 rgba 后套用调色板输出 GIF；diff_mode=rectangle 只重算帧间变化的区域。
+# 宽度不超过 512 时目标尺寸与输入一致，scale 滤镜直接透传帧，不再执行 lanczos 重采样
+_GIF_SCALE_FILTER = "fps=15,scale='min(512,iw)':-1:flags=lanczos"
+_GIF_PALETTEGEN_FILTER = "palettegen=stats_mode=diff:reserve_transparent=on"
+_GIF_PALETTEUSE_FILTER = (
+    "paletteuse=dither=bayer:bayer_scale=5:alpha_threshold=128:diff_mode=rectangle"
+)
 _GIF_TRANSPARENT_FILTER = (
-    "[0:v]format=rgba,fps=15,scale=512:-1:flags=lanczos,split[s0][s1];"
-    "[s0]palettegen=stats_mode=diff:reserve_transparent=on[p];"
-    "[s1][p]paletteuse=dither=bayer:bayer_scale=5:alpha_threshold=128"
+    f"[0:v]{_GIF_SCALE_FILTER},split[s0][s1];"
+    f"[s0]{_GIF_PALETTEGEN_FILTER}[p];"
+    "[s1]format=rgba[s1f];"
+    f"[s1f][p]{_GIF_PALETTEUSE_FILTER}"
+)
+# 同一表情包风格相近：首个贴纸在转换的同时把调色板额外输出到 [palette]，
+# 后续贴纸以第二路输入 [1:v] 直接套用，省去 palettegen 的统计开销
+_GIF_EXPORT_PALETTE_FILTER = (
+    f"[0:v]{_GIF_SCALE_FILTER},split[s0][s1];"
+    f"[s0]{_GIF_PALETTEGEN_FILTER},split[p][palette];"
+    "[s1]format=rgba[s1f];"
+    f"[s1f][p]{_GIF_PALETTEUSE_FILTER}[gif]"
 )
+_GIF_REUSE_PALETTE_FILTER = (
+    f"[0:v]{_GIF_SCALE_FILTER},format=rgba[s];[s][1:v]{_GIF_PALETTEUSE_FILTER}"
+)
+
+# GIF 直接写到 stdout，省去输出临时文件；gif 封装默认即无限循环（-loop 0），无需显式指定
+_GIF_OUTPUT_ARGS = ("-filter_complex", _GIF_TRANSPARENT_FILTER, "-f", "gif", "pipe:1")
+
+
+# 仍需落盘的输入优先写到内存文件系统（Linux 的 /dev/shm），不可用时使用系统默认临时目录
+_SHM_DIR = "/dev/shm"
+_TEMP_DIR = _SHM_DIR if os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK) else None
+
+# 飞书可直接发送、无需转换的 mime 类型
+_PASSTHROUGH_MIMES = frozenset({"image/png", "image/jpeg", "image/jpg", "image/gif"})
+
+_CONVERT_CACHE_MAXSIZE = 512
+_CONVERT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_PALETTE_CACHE_MAXSIZE = 128
+
+# (转换器名称, 原始内容摘要)
+_CacheKey = tuple[str, bytes]
+_Converter = Callable[[StickerAsset], Awaitable[StickerAsset]]
 
 
 class UnsupportedMediaError(Exception):
@@ -25,8 +73,40 @@ class UnsupportedMediaError(Exception):
 class FfmpegMediaNormalizer:
     """将 Telegram 媒体归一化为飞书可稳定发送的格式。"""
 
+    def __init__(
+        self,
+        cache_maxsize: int = _CONVERT_CACHE_MAXSIZE,
+        cache_max_bytes: int = _CONVERT_CACHE_MAX_BYTES,
+        max_concurrent_conversions: int | None = None,
+    ) -> None:
+        # 热门贴纸会被大量重复转发，按内容摘要缓存转换结果，命中时跳过 ffmpeg
+        self._cache_maxsize = cache_maxsize
+        self._cache_max_bytes = cache_max_bytes
+        self._cache: OrderedDict[_CacheKey, StickerAsset] = OrderedDict()
+        self._cache_bytes = 0
+        # 同一内容的并发首次转换只执行一次，其余请求等待同一任务
+        self._inflight: dict[_CacheKey, asyncio.Task[StickerAsset]] = {}
+        # 限制同时运行的转换进程数，突发消息时避免进程争抢 CPU
+        self._conversion_slots = asyncio.Semaphore(
+            max_concurrent_conversions or os.cpu_count() or 2
+        )
+        # 表情包名称 -> 调色板 PNG，同包后续贴纸转 GIF 时复用
+        self._palette_cache: OrderedDict[str, bytes] = OrderedDict()
+        # 按 mime 精确匹配的处理方式，一次字典查找代替逐个条件判断
+        convert_tgs = partial(self._convert_cached, convert=self._convert_tgs_to_gif)
+        convert_webp = partial(self._convert_cached, convert=self._convert_to_png)
+        self._mime_handlers: dict[str, _Converter] = {
+            "application/x-tgsticker": convert_tgs,
+            "image/webp": convert_webp,
+            "application/webp": convert_webp,
+        }
+
     async def normalize(self, asset: StickerAsset) -> StickerAsset:
         mime = asset.mime_type.lower()
+        # 飞书可直接发送的格式占大多数，最先判断以免走后续分支
+        if mime in _PASSTHROUGH_MIMES:
+            return asset
+
         logger.debug(
             "开始归一化: file=%s kind=%s mime=%s animated=%s",
             asset.file_name,
@@ -35,183 +115,312 @@ class FfmpegMediaNormalizer:
             asset.is_animated,
         )
 
-        if mime == "application/x-tgsticker":
-            logger.info("检测到 TGS 贴纸，转换为 GIF: %s", asset.file_name)
-            return await self._convert_tgs_to_gif(asset)
+        handler = self._mime_handlers.get(mime)
+        if handler is not None:
+            return await handler(asset)
 
         if asset.media_kind == "video" or mime.startswith("video/"):
-            logger.info("检测到视频素材，转换为 GIF: %s", asset.file_name)
-            return await self._convert_to_gif(asset)
-
-        if asset.media_kind == "gif" and mime == "image/gif":
-            return asset
-
-        if mime in {"image/png", "image/jpeg", "image/jpg", "image/gif"}:
-            return asset
-
-        if mime in {"image/webp", "application/webp"}:
-            logger.info("检测到 WebP 素材，转换为 PNG: %s", asset.file_name)
-            return await self._convert_to_png(asset)
+            return await self._convert_cached(asset, self._convert_to_gif)
 
         if asset.is_animated:
-            return await self._convert_to_gif(asset)
+            return await self._convert_cached(asset, self._convert_to_gif)
 
         logger.info("未知 mime 类型，尝试原样发送: %s", asset.mime_type)
         return asset
 
-    async def _convert_tgs_to_gif(self, asset: StickerAsset) -> StickerAsset:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".tgs") as in_file:
-            in_file.write(asset.content)
-            in_path = Path(in_file.name)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".gif") as out_file:
-            out_path = Path(out_file.name)
+    async def _convert_cached(self, asset: StickerAsset, convert: _Converter) -> StickerAsset:
+        key = (convert.__name__, hashlib.blake2b(asset.content, digest_size=16).digest())
+        converted = self._cache.get(key)
+        if converted is not None:
+            self._cache.move_to_end(key)
+            logger.debug("命中转换缓存: file=%s", asset.file_name)
+        else:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._convert_and_store(key, asset, convert))
+                self._inflight[key] = task
+            # shield：某个等待者被取消时不影响其他共享同一任务的请求
+            converted = await asyncio.shield(task)
+
+        # 缓存的是首个请求的结果，来源与文件名需换成当前请求的（content 仅引用，不复制）
+        return dataclasses.replace(
+            converted,
+            source_platform=asset.source_platform,
+            source_user_id=asset.source_user_id,
+            file_name=f"{_file_stem(asset.file_name)}{_file_suffix(converted.file_name)}",
+        )
 
+    async def _convert_and_store(
+        self, key: _CacheKey, asset: StickerAsset, convert: _Converter
+    ) -> StickerAsset:
         try:
-            try:
-                await _run_command(
-                    ["lottie_convert.py", str(in_path), str(out_path)],
-                    "lottie_convert.py TGS 转 GIF",
-                )
-            except UnsupportedMediaError as lottie_error:
-                logger.warning("lottie_convert.py 转换失败，回退到 ffmpeg: %s", lottie_error)
-                await _run_ffmpeg(
-                    [
-                        "-i",
-                        str(in_path),
-                        "-filter_complex",
-                        _GIF_TRANSPARENT_FILTER,
-                        "-loop",
-                        "0",
-                        str(out_path),
-                    ]
-                )
+            async with self._conversion_slots:
+                converted = await convert(asset)
+        finally:
+            self._inflight.pop(key, None)
+
+        size = len(converted.content)
+        if size <= self._cache_max_bytes:
+            self._cache[key] = converted
+            self._cache_bytes += size
+            while (
+                len(self._cache) > self._cache_maxsize or self._cache_bytes > self._cache_max_bytes
+            ):
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted.content)
+        return converted
 
-            content = out_path.read_bytes()
-            return StickerAsset(
-                source_platform=asset.source_platform,
-                source_user_id=asset.source_user_id,
-                media_kind="gif",
-                mime_type="image/gif",
-                file_name=f"{Path(asset.file_name).stem}.gif",
-                content=content,
-                is_animated=True,
+    async def _convert_tgs_to_gif(self, asset: StickerAsset) -> StickerAsset:
+        logger.info("检测到 TGS 贴纸，转换为 GIF: %s", asset.file_name)
+        try:
+            # 在进程内调用 lottie 渲染，省去启动 lottie_convert.py 解释器与临时文件
+            content = await asyncio.to_thread(_tgs_to_gif, asset.content)
+        except Exception as lottie_error:  # noqa: BLE001
+            logger.warning(
+                "lottie 转换 TGS 失败，回退到 ffmpeg: file=%s error=%s",
+                asset.file_name,
+                lottie_error,
             )
-        finally:
-            _safe_unlink(in_path)
-            _safe_unlink(out_path)
+            content = await _convert_tgs_with_ffmpeg(asset.content)
+
+        return StickerAsset(
+            source_platform=asset.source_platform,
+            source_user_id=asset.source_user_id,
+            media_kind="gif",
+            mime_type="image/gif",
+            file_name=f"{_file_stem(asset.file_name)}.gif",
+            content=content,
+            is_animated=True,
+        )
 
     async def _convert_to_gif(self, asset: StickerAsset) -> StickerAsset:
+        logger.info("检测到动态素材，转换为 GIF: %s", asset.file_name)
         in_suffix = _suffix_from_filename_or_mime(asset.file_name, asset.mime_type, default=".bin")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=in_suffix) as in_file:
-            in_file.write(asset.content)
-            in_path = Path(in_file.name)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".gif") as out_file:
-            out_path = Path(out_file.name)
-
-        try:
+        if in_suffix == ".webm":
+            # webm 可顺序解析，直接经 stdin 输入；
             # 对 webm (VP9+alpha) 显式指定 libvpx-vp9 解码器以确保 alpha 通道被解码
-            input_args: list[str] = []
-            if in_suffix == ".webm":
-                input_args = ["-c:v", "libvpx-vp9"]
+            content = await self._render_gif(
+                ["-f", "matroska", "-c:v", "libvpx-vp9", "-i", "pipe:0"],
+                pack_name=asset.pack_name,
+                input_bytes=asset.content,
+            )
+        else:
+            # mp4 等容器的 moov 可能位于文件末尾，需要可 seek 的输入，仍落盘
+            with _temp_file(in_suffix, asset.content) as in_path:
+                content = await self._render_gif(["-i", str(in_path)], pack_name=asset.pack_name)
+
+        return StickerAsset(
+            source_platform=asset.source_platform,
+            source_user_id=asset.source_user_id,
+            media_kind="gif",
+            mime_type="image/gif",
+            file_name=f"{_file_stem(asset.file_name)}.gif",
+            content=content,
+            is_animated=True,
+        )
+
+    async def _render_gif(
+        self, input_args: list[str], pack_name: str | None, input_bytes: bytes | None = None
+    ) -> bytes:
+        if not pack_name:
+            return await _run_ffmpeg([*input_args, *_GIF_OUTPUT_ARGS], input_bytes=input_bytes)
+
+        palette = self._palette_cache.get(pack_name)
+        with _temp_file(".png", palette) as palette_path:
+            if palette is not None:
+                self._palette_cache.move_to_end(pack_name)
+                logger.debug("复用表情包调色板: pack=%s", pack_name)
+                return await _run_ffmpeg(
+                    [
+                        *input_args,
+                        "-i",
+                        str(palette_path),
+                        "-filter_complex",
+                        _GIF_REUSE_PALETTE_FILTER,
+                        "-f",
+                        "gif",
+                        "pipe:1",
+                    ],
+                    input_bytes=input_bytes,
+                )
 
-            await _run_ffmpeg(
+            content = await _run_ffmpeg(
                 [
                     *input_args,
-                    "-i",
-                    str(in_path),
                     "-filter_complex",
-                    _GIF_TRANSPARENT_FILTER,
-                    "-loop",
-                    "0",
-                    str(out_path),
-                ]
+                    _GIF_EXPORT_PALETTE_FILTER,
+                    "-map",
+                    "[gif]",
+                    "-f",
+                    "gif",
+                    "pipe:1",
+                    "-map",
+                    "[palette]",
+                    "-f",
+                    "image2",
+                    "-update",
+                    "1",
+                    str(palette_path),
+                ],
+                input_bytes=input_bytes,
             )
-            content = out_path.read_bytes()
-            return StickerAsset(
-                source_platform=asset.source_platform,
-                source_user_id=asset.source_user_id,
-                media_kind="gif",
-                mime_type="image/gif",
-                file_name=f"{Path(asset.file_name).stem}.gif",
-                content=content,
-                is_animated=True,
-            )
-        finally:
-            _safe_unlink(in_path)
-            _safe_unlink(out_path)
+            self._palette_cache[pack_name] = await asyncio.to_thread(palette_path.read_bytes)
+            if len(self._palette_cache) > _PALETTE_CACHE_MAXSIZE:
+                self._palette_cache.popitem(last=False)
+            return content
 
     async def _convert_to_png(self, asset: StickerAsset) -> StickerAsset:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webp") as in_file:
-            in_file.write(asset.content)
-            in_path = Path(in_file.name)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as out_file:
-            out_path = Path(out_file.name)
-
+        logger.info("检测到 WebP 素材，转换为 PNG: %s", asset.file_name)
         try:
-            await _run_ffmpeg(["-i", str(in_path), "-pix_fmt", "rgba", str(out_path)])
-            content = out_path.read_bytes()
-            return StickerAsset(
-                source_platform=asset.source_platform,
-                source_user_id=asset.source_user_id,
-                media_kind="image",
-                mime_type="image/png",
-                file_name=f"{Path(asset.file_name).stem}.png",
-                content=content,
-                is_animated=False,
+            # 静态 WebP 直接用 Pillow 在进程内解码，省去启动 ffmpeg
+            content = await asyncio.to_thread(_webp_to_png, asset.content)
+        except OSError as exc:
+            logger.warning(
+                "Pillow 解码 WebP 失败，回退到 ffmpeg: file=%s error=%s", asset.file_name, exc
             )
-        finally:
-            _safe_unlink(in_path)
-            _safe_unlink(out_path)
-
-
-async def _run_ffmpeg(args: list[str]) -> None:
-    process = await asyncio.create_subprocess_exec(
-        "ffmpeg",
-        "-y",
-        "-loglevel",
-        "error",
-        *args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+            content = await _convert_webp_with_ffmpeg(asset.content)
+        return StickerAsset(
+            source_platform=asset.source_platform,
+            source_user_id=asset.source_user_id,
+            media_kind="image",
+            mime_type="image/png",
+            file_name=f"{_file_stem(asset.file_name)}.png",
+            content=content,
+            is_animated=False,
+        )
+
+
+class _SilentProgressReporter:
+    """lottie 默认逐帧向 stderr 写进度，与应用日志共用同一输出流，替换为空实现。"""
+
+    def report_progress(self, title: str, value: int, total: int) -> None:
+        pass
+
+    def report_message(self, message: str) -> None:
+        pass
+
+
+def _tgs_to_gif(content: bytes) -> bytes:
+    from lottie.parsers.baseporter import IoProgressReporter
+
+    IoProgressReporter.instance = _SilentProgressReporter()
+
+    # 渲染后端（glaxnimate 或 cairosvg）缺失时导入即失败，由调用方回退到 ffmpeg
+    from lottie.exporters.gif import export_gif
+    from lottie.parsers.tgs import parse_tgs
+
+    animation = parse_tgs(io.BytesIO(content))
+    buffer = io.BytesIO()
+    export_gif(animation, buffer)
+    return buffer.getvalue()
+
+
+async def _convert_tgs_with_ffmpeg(content: bytes) -> bytes:
+    with _temp_file(".tgs", content) as in_path:
+        return await _run_ffmpeg(["-i", str(in_path), *_GIF_OUTPUT_ARGS])
+
+
+def _webp_to_png(content: bytes) -> bytes:
+    with Image.open(io.BytesIO(content)) as image:
+        # 动态 WebP 只取首帧，与 ffmpeg 输出单张 PNG 的行为一致
+        image.seek(0)
+        buffer = io.BytesIO()
+        image.convert("RGBA").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def _convert_webp_with_ffmpeg(content: bytes) -> bytes:
+    return await _run_ffmpeg(
+        [
+            "-f",
+            "webp_pipe",
+            "-i",
+            "pipe:0",
+            "-pix_fmt",
+            "rgba",
+            "-c:v",
+            "png",
+            "-f",
+            "image2pipe",
+            "pipe:1",
+        ],
+        input_bytes=content,
     )
-    _, stderr = await process.communicate()
-    if process.returncode != 0:
-        error_text = stderr.decode("utf-8", errors="ignore").strip()
-        raise UnsupportedMediaError(f"ffmpeg 转换失败: {error_text}")
 
 
-async def _run_command(args: list[str], action_name: str) -> None:
+async def _run_ffmpeg(args: list[str], input_bytes: bytes | None = None) -> bytes:
+    """执行 ffmpeg，可选地经 stdin 写入输入数据，返回 stdout 输出（输出到 pipe:1 时即转换结果）。"""
     try:
         process = await asyncio.create_subprocess_exec(
+            _ffmpeg_executable(),
+            "-y",
+            "-loglevel",
+            "error",
             *args,
+            stdin=(
+                asyncio.subprocess.PIPE if input_bytes is not None else asyncio.subprocess.DEVNULL
+            ),
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
     except FileNotFoundError as exc:
-        raise UnsupportedMediaError(f"{action_name}失败: 缺少命令 {args[0]}") from exc
-
-    _, stderr = await process.communicate()
+        raise UnsupportedMediaError("ffmpeg 转换失败: 缺少命令 ffmpeg") from exc
+    stdout, stderr = await process.communicate(input_bytes)
     if process.returncode != 0:
-        raise UnsupportedMediaError(
-            f"{action_name}失败: {stderr.decode('utf-8', errors='ignore').strip()}"
-        )
+        error_text = stderr.decode("utf-8", errors="ignore").strip()
+        raise UnsupportedMediaError(f"ffmpeg 转换失败: {error_text}")
+    return stdout
+
+
+@lru_cache(maxsize=1)
+def _ffmpeg_executable() -> str:
+    """解析一次 ffmpeg 绝对路径，避免每次启动进程都按 PATH 逐个目录查找。"""
+    return shutil.which("ffmpeg") or "ffmpeg"
+
+
+_SUFFIX_BY_MIME = {
+    "video/mp4": ".mp4",
+    "video/webm": ".webm",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
 
 
 def _suffix_from_filename_or_mime(file_name: str, mime_type: str, default: str) -> str:
-    suffix = Path(file_name).suffix
+    suffix = _file_suffix(file_name)
     if suffix:
         return suffix
 
-    mapping = {
-        "video/mp4": ".mp4",
-        "video/webm": ".webm",
-        "image/gif": ".gif",
-        "image/webp": ".webp",
-    }
-    return mapping.get(mime_type.lower(), default)
+    return _SUFFIX_BY_MIME.get(mime_type.lower(), default)
+
+
+# 文件名来自 Telegram，不含目录，直接按最后一个 . 切分即可，无需构造 Path 对象
+def _file_stem(file_name: str) -> str:
+    stem, dot, extension = file_name.rpartition(".")
+    return stem if dot and stem and extension else file_name
+
+
+def _file_suffix(file_name: str) -> str:
+    stem, dot, extension = file_name.rpartition(".")
+    return f".{extension}" if dot and stem and extension else ""
+
+
+@contextmanager
+def _temp_file(suffix: str, content: bytes | None = None) -> Iterator[Path]:
+    """创建（可选写入内容的）临时文件，退出时在后台删除。"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=_TEMP_DIR) as file:
+        if content:
+            file.write(content)
+        path = Path(file.name)
+    try:
+        yield path
+    finally:
+        _schedule_unlink(path)
+
+
+def _schedule_unlink(path: Path) -> None:
+    """在线程池中删除临时文件，不阻塞当前协程返回结果。"""
+    asyncio.get_running_loop().run_in_executor(None, _safe_unlink, path)
 
 
 def _safe_unlink(path: Path) -> None:
@@ -219,3 +428,6 @@ def _safe_unlink(path: Path) -> None:
         os.unlink(path)
     except FileNotFoundError:
         return
+    except OSError as exc:
+        # 后台删除没有调用方接收异常，这里记录后吞掉
+        logger.warning("删除临时文件失败: path=%s error=%s", path, exc)
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+from collections.abc import Awaitable, Callable
 
 from stickerhub.core.models import StickerAsset
 from stickerhub.core.ports import MediaNormalizer, TargetPlatformSender
@@ -6,6 +8,8 @@ from stickerhub.services.binding import BindingService
 
 logger = logging.getLogger(__name__)
 
+AssetDelivery = Callable[[], Awaitable[None]]
+
 
 class RelayStickerUseCase:
     """编排来源平台素材 -> 归一化 -> 目标平台发送。"""
@@ -21,6 +25,17 @@ class RelayStickerUseCase:
         self._binding_service = binding_service
 
     async def relay(self, asset: StickerAsset) -> None:
+        deliver = await self.prepare(asset)
+        if deliver is not None:
+            await deliver()
+
+    async def prepare(self, asset: StickerAsset) -> AssetDelivery | None:
+        """
+        完成转发前的准备（归一化与上传），返回真正发出消息的回调。
+
+        准备阶段耗时且互不依赖，可以并发执行；调用方再按需要的顺序调用返回的回调。
+        无需转发时返回 None。
+        """
         logger.debug(
             "开始转发素材: source=%s user=%s kind=%s mime=%s",
             asset.source_platform,
@@ -29,9 +44,10 @@ class RelayStickerUseCase:
             asset.mime_type,
         )
 
-        if not self._target_sender:
+        sender = self._target_sender
+        if not sender:
             logger.debug("未配置目标平台发送器，跳过飞书转发")
-            return
+            return None
 
         target = await self._binding_service.get_feishu_target(
             source_platform=asset.source_platform,
@@ -42,19 +58,28 @@ class RelayStickerUseCase:
                 "用户未绑定飞书，跳过飞书转发: user=%s",
                 asset.source_user_id,
             )
-            return
+            return None
 
-        normalized = await self._normalizer.normalize(asset)
-        await self._target_sender.send(
-            normalized,
-            target_mode=target.mode,
-            target=target.target,
-        )
-        logger.info(
-            "转发成功: source=%s user=%s mode=%s kind=%s mime=%s",
-            asset.source_platform,
-            asset.source_user_id,
-            target.mode,
-            normalized.media_kind,
-            normalized.mime_type,
+        # ffmpeg 转换与获取飞书凭据互不依赖，并行执行以缩短端到端耗时
+        normalized, _ = await asyncio.gather(
+            self._normalizer.normalize(asset),
+            sender.prepare(),
         )
+        media_key = await sender.upload(normalized)
+
+        async def deliver() -> None:
+            await sender.send_uploaded(
+                media_key,
+                target_mode=target.mode,
+                target=target.target,
+            )
+            logger.info(
+                "转发成功: source=%s user=%s mode=%s kind=%s mime=%s",
+                asset.source_platform,
+                asset.source_user_id,
+                target.mode,
+                normalized.media_kind,
+                normalized.mime_type,
+            )
+
+        return deliver
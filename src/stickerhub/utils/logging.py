@@ -2,6 +2,11 @@ import logging
 
 
 def setup_logging(level: str) -> None:
+    # 日志格式不使用进程/线程字段，跳过每条 LogRecord 的相关查询
+    logging.logMultiprocessing = False
+    logging.logProcesses = False
+    logging.logThreads = False
+    logging.logAsyncioTasks = False
     logging.basicConfig(
         level=level.upper(),
         format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
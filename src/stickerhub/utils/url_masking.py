@@ -1,12 +1,23 @@
 """Shared constants and utilities for URL masking to prevent credential leakage in logs."""
 
-from urllib.parse import urlparse
+import ipaddress
+import re
+import unicodedata
+from urllib.parse import uses_params
 
 # URL masking constants
 PATH_PREFIX_LENGTH = 20
 PATH_SUFFIX_LENGTH = 8
 PATH_MASK_THRESHOLD = PATH_PREFIX_LENGTH + PATH_SUFFIX_LENGTH
 
+_MASKED = "[url_masked]"
+_SCHEME_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-.")
+# 与 urlparse 一致：去掉开头的 C0 控制字符与空格，并删除任意位置的制表符与换行，防止日志注入
+_LEADING_C0_CONTROL_OR_SPACE = "".join(chr(code) for code in range(0x21))
+_UNSAFE_CHARS_TABLE = str.maketrans("", "", "\t\r\n")
+_IPVFUTURE_RE = re.compile(r"\Av[a-fA-F0-9]+\..+\Z")
+_PARAMS_SCHEMES = frozenset(uses_params)
+
 
 def mask_url(url: str) -> str:
     """
@@ -15,22 +26,70 @@ def mask_url(url: str) -> str:
     仅保留协议、域名（hostname）、路径前 20 个字符和后 8 个字符，中间用 ... 替代。
     不包含 userinfo、端口、query、fragment 等敏感信息。
     """
+    if not isinstance(url, str):
+        return _MASKED
+
+    # 只需要协议、主机名与路径，手工切片比 urlparse 完整解析便宜得多。
+    # 不做缓存：缓存键是未脱敏的原始 URL，会让带 token 的地址常驻内存
+    url = url.lstrip(_LEADING_C0_CONTROL_OR_SPACE).translate(_UNSAFE_CHARS_TABLE)
+    scheme, sep, rest = url.partition("://")
+    if not sep or not scheme or not scheme[0].isalpha() or not _SCHEME_CHARS.issuperset(scheme):
+        return _MASKED
+
+    end = len(rest)
+    for delimiter in "?#":
+        index = rest.find(delimiter)
+        if 0 <= index < end:
+            end = index
+    slash = rest.find("/", 0, end)
+    netloc_end = slash if slash >= 0 else end
+    netloc = rest[:netloc_end]
+    path = rest[netloc_end:end]
+    scheme = scheme.lower()
+    # 与 urlparse 一致，支持参数的协议中最后一段路径 ; 之后的参数不属于 path
+    if scheme in _PARAMS_SCHEMES:
+        params = path.find(";", path.rfind("/") + 1)
+        if params >= 0:
+            path = path[:params]
+
+    # 去掉 userinfo 与端口，仅保留 hostname
+    host_and_port = netloc.rpartition("@")[2]
+    before_bracket, bracket, bracketed = host_and_port.partition("[")
+    if bracket:
+        host, _, port = bracketed.partition("]")
+        if before_bracket or (port and not port.startswith(":")):
+            return _MASKED
+    else:
+        host = host_and_port.partition(":")[0]
+    # 与 urlparse 一致：方括号须成对出现，且出现时主机名只能是 IPv6 地址或 IPvFuture
+    has_open, has_close = "[" in netloc, "]" in netloc
+    if has_open != has_close or (has_open and not _is_bracketed_host(host)):
+        return _MASKED
+    if not host or not _is_nfkc_safe(netloc):
+        return _MASKED
+
+    if len(path) > PATH_MASK_THRESHOLD:
+        path = f"{path[:PATH_PREFIX_LENGTH]}...{path[-PATH_SUFFIX_LENGTH:]}"
+
+    # IPv6 zone id 区分大小写，只转换 % 之前的部分
+    host, percent, zone = host.partition("%")
+    return f"{scheme}://{host.lower()}{percent}{zone}{path}"
+
+
+def _is_bracketed_host(host: str) -> bool:
+    """方括号内只允许 IPv6 地址或 IPvFuture，与 urlparse 的校验一致。"""
+    if host.startswith("v"):
+        return _IPVFUTURE_RE.match(host) is not None
     try:
-        parsed = urlparse(url)
-
-        # 仅在解析结果有明确的协议和主机名时才返回拼接后的 URL
-        if not parsed.scheme or not parsed.hostname:
-            return "[url_masked]"
-
-        if parsed.path and len(parsed.path) > PATH_MASK_THRESHOLD:
-            masked_path = (
-                f"{parsed.path[:PATH_PREFIX_LENGTH]}...{parsed.path[-PATH_SUFFIX_LENGTH:]}"
-            )
-        else:
-            masked_path = parsed.path
-
-        # 仅使用 hostname，避免将 userinfo、端口等敏感信息写入日志
-        return f"{parsed.scheme}://{parsed.hostname}{masked_path}"
-    except (ValueError, TypeError, AttributeError):
-        # urlparse 可能抛出 ValueError，或传入 None 导致 TypeError/AttributeError
-        return "[url_masked]"
+        return isinstance(ipaddress.ip_address(host), ipaddress.IPv6Address)
+    except ValueError:
+        return False
+
+
+def _is_nfkc_safe(netloc: str) -> bool:
+    """拒绝 NFKC 归一化后会引入 URL 分隔符的非 ASCII 主机部分（如 \\u2100 -> a/c）。"""
+    if netloc.isascii():
+        return True
+    chars = netloc.replace("@", "").replace(":", "").replace("#", "").replace("?", "")
+    normalized = unicodedata.normalize("NFKC", chars)
+    return normalized == chars or not any(c in normalized for c in "/?#@:")
@@ -1,16 +1,65 @@
 import asyncio
 import re
+import sqlite3
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import closing
 
-from stickerhub.services.binding import BindingService, BindingStore
+import pytest
 
+from stickerhub.services.binding import BindingService, BindingStore, _normalize_feishu_webhook_url
 
-async def _bind_flow(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
+_BIND_CODE_RE = re.compile(r"/bind\s+([A-Z0-9]+)")
+# 测试数据库用完即弃，关闭 fsync 加快每次写入
+_TEST_PRAGMAS = {"synchronous": "OFF"}
+
+
+def _memory_db_uri() -> str:
+    # 不依赖文件特性（WAL、读连接池）的用例使用独立命名的内存库，省去磁盘读写
+    return f"file:binding_{uuid.uuid4().hex}?mode=memory&cache=shared"
+
+
+@pytest.fixture
+async def store() -> AsyncIterator[BindingStore]:
+    binding_store = BindingStore(_memory_db_uri(), pragmas=_TEST_PRAGMAS)
+    await binding_store.ensure_initialized()
+    yield binding_store
+    await binding_store.close()
+
+
+@pytest.fixture
+async def service(store: BindingStore) -> BindingService:
+    binding_service = BindingService(store=store, magic_ttl_seconds=600)
+    await binding_service.initialize()
+    return binding_service
+
+
+@pytest.fixture
+async def make_service() -> AsyncIterator[Callable[..., Awaitable[BindingService]]]:
+    """按需创建独立配置的 BindingService，用例结束时统一关闭。"""
+    services: list[BindingService] = []
+
+    async def _make(db_path: str, webhook_allowed_hosts: list[str] | None = None) -> BindingService:
+        service = BindingService(
+            store=BindingStore(db_path, pragmas=_TEST_PRAGMAS),
+            magic_ttl_seconds=600,
+            webhook_allowed_hosts=webhook_allowed_hosts,
+        )
+        services.append(service)
+        await service.initialize()
+        return service
+
+    yield _make
+    for service in services:
+        await service.close()
+
+
+@pytest.mark.parametrize("in_memory", [False, True], ids=["file", "memory"])
+async def test_bind_flow(tmp_path, make_service, in_memory: bool) -> None:
+    service = await make_service(":memory:" if in_memory else str(tmp_path / "binding.db"))
 
     first_reply = await service.handle_bind_command("telegram", "tg_user_1", None)
-    match = re.search(r"/bind\s+([A-Z0-9]+)", first_reply)
+    match = _BIND_CODE_RE.search(first_reply)
     assert match is not None
     code = match.group(1)
 
@@ -21,13 +70,9 @@ async def _bind_flow(db_path: str) -> None:
     assert target == "ou_xxx"
 
 
-async def _code_can_only_be_used_once(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_magic_code_single_use(service: BindingService) -> None:
     first_reply = await service.handle_bind_command("telegram", "tg_user_2", None)
-    match = re.search(r"/bind\s+([A-Z0-9]+)", first_reply)
+    match = _BIND_CODE_RE.search(first_reply)
     assert match is not None
     code = match.group(1)
 
@@ -38,48 +83,36 @@ async def _code_can_only_be_used_once(db_path: str) -> None:
     assert "已被使用" in fail_reply
 
 
-async def _rebind_current_account_to_new_hub(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_rebind_current_account_to_new_hub(service: BindingService) -> None:
     # 先让 feishu:ou_user 绑定到 hub_a
     tg_a_reply = await service.handle_bind_command("telegram", "tg_a", None)
-    code_a = re.search(r"/bind\s+([A-Z0-9]+)", tg_a_reply).group(1)  # type: ignore[union-attr]
+    code_a = _BIND_CODE_RE.search(tg_a_reply).group(1)  # type: ignore[union-attr]
     assert "绑定成功" in await service.handle_bind_command("feishu", "ou_user", code_a)
 
     # 再让同一个 feishu:ou_user 绑定到 hub_b，应该覆盖而不是拦截
     tg_b_reply = await service.handle_bind_command("telegram", "tg_b", None)
-    code_b = re.search(r"/bind\s+([A-Z0-9]+)", tg_b_reply).group(1)  # type: ignore[union-attr]
+    code_b = _BIND_CODE_RE.search(tg_b_reply).group(1)  # type: ignore[union-attr]
     assert "绑定成功" in await service.handle_bind_command("feishu", "ou_user", code_b)
 
     assert await service.get_target_user_id("telegram", "tg_b", "feishu") == "ou_user"
     assert await service.get_target_user_id("telegram", "tg_a", "feishu") is None
 
 
-async def _rebind_replaces_existing_account_on_same_hub(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_rebind_replaces_existing_account_on_same_hub(service: BindingService) -> None:
     # hub_x <- feishu:ou_old
     tg_reply = await service.handle_bind_command("telegram", "tg_x", None)
-    code_x = re.search(r"/bind\s+([A-Z0-9]+)", tg_reply).group(1)  # type: ignore[union-attr]
+    code_x = _BIND_CODE_RE.search(tg_reply).group(1)  # type: ignore[union-attr]
     assert "绑定成功" in await service.handle_bind_command("feishu", "ou_old", code_x)
 
     # 同 hub_x 再绑定 feishu:ou_new，旧账号应让位
     tg_reply2 = await service.handle_bind_command("telegram", "tg_x", None)
-    code_x2 = re.search(r"/bind\s+([A-Z0-9]+)", tg_reply2).group(1)  # type: ignore[union-attr]
+    code_x2 = _BIND_CODE_RE.search(tg_reply2).group(1)  # type: ignore[union-attr]
     assert "绑定成功" in await service.handle_bind_command("feishu", "ou_new", code_x2)
 
     assert await service.get_target_user_id("telegram", "tg_x", "feishu") == "ou_new"
 
 
-async def _bind_webhook_flow(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_bind_webhook_flow(service: BindingService) -> None:
     webhook_url = "https://open.feishu.cn/open-apis/bot/v2/hook/test_webhook"
     reply = await service.handle_bind_webhook("telegram", "tg_webhook", webhook_url)
     assert "绑定成功" in reply
@@ -91,13 +124,9 @@ async def _bind_webhook_flow(db_path: str) -> None:
     assert await service.get_target_user_id("telegram", "tg_webhook", "feishu") is None
 
 
-async def _switch_from_bot_to_webhook(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_switch_from_bot_to_webhook(service: BindingService) -> None:
     tg_reply = await service.handle_bind_command("telegram", "tg_switch", None)
-    code = re.search(r"/bind\s+([A-Z0-9]+)", tg_reply).group(1)  # type: ignore[union-attr]
+    code = _BIND_CODE_RE.search(tg_reply).group(1)  # type: ignore[union-attr]
     assert "绑定成功" in await service.handle_bind_command("feishu", "ou_switch_old", code)
 
     webhook_url = "https://open.feishu.cn/open-apis/bot/v2/hook/switch_webhook"
@@ -110,16 +139,12 @@ async def _switch_from_bot_to_webhook(db_path: str) -> None:
     assert await service.get_target_user_id("telegram", "tg_switch", "feishu") is None
 
 
-async def _switch_from_webhook_to_bot(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_switch_from_webhook_to_bot(service: BindingService) -> None:
     webhook_url = "https://open.feishu.cn/open-apis/bot/v2/hook/switch_back"
     assert "绑定成功" in await service.handle_bind_webhook("telegram", "tg_back", webhook_url)
 
     tg_reply = await service.handle_bind_command("telegram", "tg_back", None)
-    code = re.search(r"/bind\s+([A-Z0-9]+)", tg_reply).group(1)  # type: ignore[union-attr]
+    code = _BIND_CODE_RE.search(tg_reply).group(1)  # type: ignore[union-attr]
     assert "绑定成功" in await service.handle_bind_command("feishu", "ou_new", code)
 
     target = await service.get_feishu_target("telegram", "tg_back")
@@ -128,23 +153,15 @@ async def _switch_from_webhook_to_bot(db_path: str) -> None:
     assert target.target == "ou_new"
 
 
-async def _bind_webhook_invalid_url(db_path: str) -> None:
-    store = BindingStore(db_path)
-    service = BindingService(store=store, magic_ttl_seconds=600)
-    await service.initialize()
-
+async def test_bind_webhook_invalid_url(service: BindingService) -> None:
     reply = await service.handle_bind_webhook("telegram", "tg_invalid", "http://example.com/abc")
     assert "格式不合法" in reply
 
 
-async def _bind_webhook_domain_whitelist(db_path: str) -> None:
+async def test_bind_webhook_domain_whitelist(make_service) -> None:
     """测试域名白名单校验（SSRF 防护）"""
-    store = BindingStore(db_path)
     # 自定义白名单，仅允许 open.feishu.cn
-    service = BindingService(
-        store=store, magic_ttl_seconds=600, webhook_allowed_hosts=["open.feishu.cn"]
-    )
-    await service.initialize()
+    service = await make_service(_memory_db_uri(), webhook_allowed_hosts=["open.feishu.cn"])
 
     # 合法域名应通过（不限制端口）
     valid_url = "https://open.feishu.cn/open-apis/bot/v2/hook/valid_token"
@@ -167,12 +184,10 @@ async def _bind_webhook_domain_whitelist(db_path: str) -> None:
     assert "白名单" in reply
 
 
-async def _bind_webhook_whitelist_disabled(db_path: str) -> None:
+async def test_bind_webhook_whitelist_disabled(make_service) -> None:
     """测试禁用白名单校验"""
-    store = BindingStore(db_path)
     # 空列表表示禁用白名单
-    service = BindingService(store=store, magic_ttl_seconds=600, webhook_allowed_hosts=[])
-    await service.initialize()
+    service = await make_service(_memory_db_uri(), webhook_allowed_hosts=[])
 
     # 任意域名都应通过（白名单已禁用）
     custom_url = "https://custom.domain.com/open-apis/bot/v2/hook/custom_token"
@@ -185,51 +200,215 @@ async def _bind_webhook_whitelist_disabled(db_path: str) -> None:
     assert "绑定成功" in reply
 
 
-def test_bind_flow_with_sqlite(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_bind_flow(str(db_path)))
+async def test_meta_roundtrip(service: BindingService) -> None:
+    assert await service.get_meta("tg_commands_digest") is None
 
+    await service.set_meta("tg_commands_digest", "digest_a")
+    assert await service.get_meta("tg_commands_digest") == "digest_a"
 
-def test_magic_code_single_use(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_code_can_only_be_used_once(str(db_path)))
+    await service.set_meta("tg_commands_digest", "digest_b")
+    assert await service.get_meta("tg_commands_digest") == "digest_b"
 
 
-def test_rebind_current_account_to_new_hub(tmp_path) -> None:
+async def test_initialize_enables_wal(tmp_path, make_service) -> None:
     db_path = tmp_path / "binding.db"
-    asyncio.run(_rebind_current_account_to_new_hub(str(db_path)))
+    await make_service(str(db_path))
 
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
 
-def test_rebind_replaces_existing_account_on_same_hub(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_rebind_replaces_existing_account_on_same_hub(str(db_path)))
 
+async def test_concurrent_reads_share_reader_pool(tmp_path) -> None:
+    db_path = str(tmp_path / "binding.db")
+    store = BindingStore(db_path, reader_pool_size=2, pragmas=_TEST_PRAGMAS)
+    service = BindingService(store=store, magic_ttl_seconds=600)
+    await service.initialize()
 
-def test_bind_webhook_flow(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_bind_webhook_flow(str(db_path)))
+    await service.handle_bind_webhook(
+        "telegram", "tg_concurrent", "https://open.feishu.cn/open-apis/bot/v2/hook/concurrent"
+    )
+    targets = await asyncio.gather(
+        *[service.get_feishu_target("telegram", "tg_concurrent") for _ in range(10)]
+    )
+    assert all(target is not None and target.mode == "webhook" for target in targets)
 
+    await service.close()
 
-def test_switch_from_bot_to_webhook(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_switch_from_bot_to_webhook(str(db_path)))
 
+async def test_force_bind_reports_replaced_account(store: BindingStore) -> None:
+    await store.bind_platform("feishu", "ou_old", "hub_1")
+    details = await store.force_bind_platform("feishu", "ou_new", "hub_1")
+    assert details == {"previous_hub_id": None, "replaced_user_id": "ou_old"}
 
-def test_switch_from_webhook_to_bot(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_switch_from_webhook_to_bot(str(db_path)))
+    details = await store.force_bind_platform("feishu", "ou_new", "hub_2")
+    assert details == {"previous_hub_id": "hub_1", "replaced_user_id": None}
+    assert await store.get_platform_user_id("feishu", "hub_1") is None
 
 
-def test_bind_webhook_invalid_url(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_bind_webhook_invalid_url(str(db_path)))
+async def test_cached_lookups_follow_rebinds(service: BindingService) -> None:
+    # 先查询一次，让“未绑定”结果进入缓存
+    assert await service.get_feishu_target("telegram", "tg_cache") is None
 
+    tg_reply = await service.handle_bind_command("telegram", "tg_cache", None)
+    code = _BIND_CODE_RE.search(tg_reply).group(1)  # type: ignore[union-attr]
+    assert "绑定成功" in await service.handle_bind_command("feishu", "ou_cache_old", code)
+    assert await service.get_target_user_id("telegram", "tg_cache", "feishu") == "ou_cache_old"
 
-def test_bind_webhook_domain_whitelist(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_bind_webhook_domain_whitelist(str(db_path)))
+    tg_reply = await service.handle_bind_command("telegram", "tg_cache", None)
+    code = _BIND_CODE_RE.search(tg_reply).group(1)  # type: ignore[union-attr]
+    assert "绑定成功" in await service.handle_bind_command("feishu", "ou_cache_new", code)
+    assert await service.get_target_user_id("telegram", "tg_cache", "feishu") == "ou_cache_new"
 
+    webhook_url = "https://open.feishu.cn/open-apis/bot/v2/hook/cache_webhook"
+    assert "绑定成功" in await service.handle_bind_webhook("telegram", "tg_cache", webhook_url)
+    target = await service.get_feishu_target("telegram", "tg_cache")
+    assert target is not None
+    assert target.mode == "webhook"
+    assert await service.get_target_user_id("telegram", "tg_cache", "feishu") is None
+
+
+def test_normalize_feishu_webhook_url_prechecks() -> None:
+    hosts = frozenset({"open.feishu.cn"})
+    url = "https://open.feishu.cn/open-apis/bot/v2/hook/token"
+
+    assert _normalize_feishu_webhook_url(f"  {url}  ", hosts) == url
+    assert _normalize_feishu_webhook_url(url.replace("https", "HTTPS", 1), hosts) is not None
+    assert _normalize_feishu_webhook_url(url.replace("https", "http", 1), hosts) is None
+    assert _normalize_feishu_webhook_url("https://open.feishu.cn/open-apis/other", hosts) is None
+    assert (
+        _normalize_feishu_webhook_url(
+            "https://evil.com/x?u=/open-apis/bot/v2/hook/token", frozenset()
+        )
+        is None
+    )
 
-def test_bind_webhook_whitelist_disabled(tmp_path) -> None:
-    db_path = tmp_path / "binding.db"
-    asyncio.run(_bind_webhook_whitelist_disabled(str(db_path)))
+
+async def test_create_magic_code_purges_stale_rows(tmp_path) -> None:
+    db_path = str(tmp_path / "binding.db")
+    store = BindingStore(db_path, pragmas=_TEST_PRAGMAS)
+    await store.ensure_initialized()
+
+    used_code = await store.create_magic_code("hub_purge", ttl_seconds=600)
+    ok, _, _ = await store.consume_magic_code(used_code)
+    assert ok
+    await store.create_magic_code("hub_purge", ttl_seconds=-1)
+
+    fresh_code = await store.create_magic_code("hub_purge", ttl_seconds=600)
+    await store.close()
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        codes = [row[0] for row in conn.execute("SELECT code FROM magic_codes")]
+    assert codes == [fresh_code]
+
+
+async def test_magic_code_honours_explicit_now(store: BindingStore) -> None:
+    code = await store.create_magic_code("hub_now", ttl_seconds=60, now=1_000)
+    ok, _, reason = await store.consume_magic_code(code, now=1_061)
+    assert not ok
+    assert reason == "魔法字符串已过期"
+
+    code = await store.create_magic_code("hub_now", ttl_seconds=60, now=1_000)
+    ok, hub_id, _ = await store.consume_magic_code(code, now=1_060)
+    assert ok
+    assert hub_id == "hub_now"
+
+
+async def test_resolve_targets_with_cold_cache(tmp_path, make_service) -> None:
+    db_path = str(tmp_path / "binding.db")
+    service = await make_service(db_path)
+
+    tg_reply = await service.handle_bind_command("telegram", "tg_cold", None)
+    code = _BIND_CODE_RE.search(tg_reply).group(1)  # type: ignore[union-attr]
+    assert "绑定成功" in await service.handle_bind_command("feishu", "ou_cold", code)
+    await service.close()
+
+    # 新实例的进程内缓存为空，查询走合并后的 JOIN 语句
+    cold_service = await make_service(db_path)
+
+    assert await cold_service.get_target_user_id("telegram", "tg_cold", "feishu") == "ou_cold"
+    assert await cold_service.get_target_user_id("feishu", "ou_cold", "telegram") == "tg_cold"
+    assert await cold_service.get_target_user_id("telegram", "tg_unknown", "feishu") is None
+
+    target = await cold_service.get_feishu_target("telegram", "tg_cold")
+    assert target is not None
+    assert (target.mode, target.target) == ("bot", "ou_cold")
+    assert await cold_service.get_feishu_target("telegram", "tg_unknown") is None
+
+
+async def test_custom_pragmas_applied(tmp_path) -> None:
+    db_path = str(tmp_path / "binding.db")
+    store = BindingStore(db_path, pragmas={"synchronous": "OFF", "cache_size": -2000})
+    await store.ensure_initialized()
+
+    def _read(conn: sqlite3.Connection) -> tuple[int, int, int]:
+        return (
+            conn.execute("PRAGMA synchronous").fetchone()[0],
+            conn.execute("PRAGMA cache_size").fetchone()[0],
+            conn.execute("PRAGMA temp_store").fetchone()[0],
+        )
+
+    # synchronous=OFF -> 0，temp_store=MEMORY -> 2（默认值仍然保留）
+    assert await store._run_write(_read) == (0, -2000, 2)
+    await store.close()
+
+
+async def test_redeem_magic_code_binds_in_one_transaction(store: BindingStore) -> None:
+    await store.bind_feishu_webhook("hub_1", "https://open.feishu.cn/open-apis/bot/v2/hook/x")
+    await store.bind_platform("feishu", "ou_old", "hub_1")
+    code = await store.create_magic_code("hub_1", ttl_seconds=600)
+
+    ok, hub_id, _, details = await store.redeem_magic_code(
+        code, "feishu", "ou_new", clear_feishu_webhook=True
+    )
+    assert (ok, hub_id) == (True, "hub_1")
+    assert details == {"previous_hub_id": None, "replaced_user_id": "ou_old"}
+    assert await store.get_platform_user_id("feishu", "hub_1") == "ou_new"
+    assert await store.get_feishu_webhook("hub_1") is None
+
+    ok, hub_id, reason, details = await store.redeem_magic_code(code, "feishu", "ou_other")
+    assert (ok, hub_id, reason, details) == (False, None, "魔法字符串已被使用", {})
+    assert await store.get_hub_id("feishu", "ou_other") is None
+
+
+async def test_ensure_initialized_is_idempotent(tmp_path) -> None:
+    store = BindingStore(str(tmp_path / "binding.db"), reader_pool_size=2, pragmas=_TEST_PRAGMAS)
+    await store.ensure_initialized()
+    writer = store._writer
+    await store.bind_platform("telegram", "tg_pool", "hub_pool")
+
+    await store.ensure_initialized()
+
+    assert store._writer is writer
+    assert len(store._reader_conns) == store._readers.qsize() == 2
+    assert await store.get_hub_id("telegram", "tg_pool") == "hub_pool"
+    await store.close()
+
+
+async def test_close_waits_for_inflight_reads(tmp_path) -> None:
+    store = BindingStore(str(tmp_path / "binding.db"), reader_pool_size=2, pragmas=_TEST_PRAGMAS)
+    await store.ensure_initialized()
+    await store.bind_platform("telegram", "tg_close", "hub_close")
+
+    reads = [asyncio.create_task(store._fetchone("SELECT ?", (index,))) for index in range(8)]
+    await asyncio.sleep(0)
+    await store.close()
+
+    done = await asyncio.gather(*reads, return_exceptions=True)
+    assert not any(isinstance(result, sqlite3.ProgrammingError) for result in done)
+    with pytest.raises(RuntimeError):
+        await store.get_hub_id("telegram", "tg_other")
+    with pytest.raises(RuntimeError):
+        await store.ensure_initialized()
+
+
+async def test_file_memory_uri_detected_as_in_memory() -> None:
+    store = BindingStore("file::memory:", pragmas=_TEST_PRAGMAS)
+    await store.ensure_initialized()
+
+    # 每个新连接都是独立的空库，读操作必须复用写连接
+    assert store._reader_conns == []
+    assert await store.get_hub_id("telegram", "1") is None
+    await store.bind_platform("telegram", "1", "hub_1")
+    assert await store.get_platform_user_id("telegram", "hub_1") == "1"
+    await store.close()
@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+
+from stickerhub.adapters.feishu_sender import FeishuSender
+
+
+async def test_tenant_token_cached_until_expiry() -> None:
+    token_requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal token_requests
+        token_requests += 1
+        return httpx.Response(
+            200, json={"code": 0, "tenant_access_token": f"t-{token_requests}", "expire": 7200}
+        )
+
+    sender = FeishuSender(app_id="cli_test", app_secret="secret")
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        tokens = await asyncio.gather(*(sender._get_tenant_token(client) for _ in range(3)))
+        assert tokens == ["t-1", "t-1", "t-1"]
+
+        sender._tenant_token_expires_at = 0.0
+        assert await sender._get_tenant_token(client) == "t-2"
+
+    assert token_requests == 2
+
+
+async def test_prepare_skips_client_when_token_cached() -> None:
+    sender = FeishuSender(app_id="cli_test", app_secret="secret")
+    sender._tenant_token = "t-cached"
+    sender._tenant_token_expires_at = float("inf")
+
+    await sender.prepare()
+
+    assert sender._client is None
+
+
+async def test_requests_share_one_client() -> None:
+    sender = FeishuSender(app_id="cli_test", app_secret="secret")
+
+    client = sender._get_client()
+    assert sender._get_client() is client
+
+    await sender.close()
+    assert client.is_closed
+    assert sender._client is None
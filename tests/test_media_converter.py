@@ -0,0 +1,166 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from stickerhub.core.models import StickerAsset
+from stickerhub.services import media_converter
+from stickerhub.services.media_converter import FfmpegMediaNormalizer, UnsupportedMediaError
+
+
+class _CountingNormalizer(FfmpegMediaNormalizer):
+    def __init__(self, **kwargs: int) -> None:
+        super().__init__(**kwargs)
+        self.png_calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def _convert_to_png(self, asset: StickerAsset) -> StickerAsset:
+        self.png_calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return StickerAsset(
+            source_platform=asset.source_platform,
+            source_user_id=asset.source_user_id,
+            media_kind="image",
+            mime_type="image/png",
+            file_name="converted.png",
+            content=b"png:" + asset.content,
+        )
+
+
+def _webp(user_id: str, file_name: str, content: bytes = b"webp-bytes") -> StickerAsset:
+    return StickerAsset(
+        source_platform="telegram",
+        source_user_id=user_id,
+        media_kind="sticker",
+        mime_type="image/webp",
+        file_name=file_name,
+        content=content,
+    )
+
+
+async def test_same_content_converted_once() -> None:
+    normalizer = _CountingNormalizer()
+
+    first, second = await asyncio.gather(
+        normalizer.normalize(_webp("u1", "a.webp")),
+        normalizer.normalize(_webp("u2", "b.webp")),
+    )
+    third = await normalizer.normalize(_webp("u3", "c.webp"))
+
+    assert normalizer.png_calls == 1
+    assert [item.file_name for item in (first, second, third)] == ["a.png", "b.png", "c.png"]
+    assert [item.source_user_id for item in (first, second, third)] == ["u1", "u2", "u3"]
+    assert third.content == b"png:webp-bytes"
+
+
+async def test_cache_evicts_least_recent() -> None:
+    normalizer = _CountingNormalizer(cache_maxsize=1)
+
+    await normalizer.normalize(_webp("u1", "a.webp", b"one"))
+    await normalizer.normalize(_webp("u1", "b.webp", b"two"))
+    await normalizer.normalize(_webp("u1", "a.webp", b"one"))
+
+    assert normalizer.png_calls == 3
+
+
+async def test_conversions_limited_by_semaphore() -> None:
+    normalizer = _CountingNormalizer(max_concurrent_conversions=2)
+
+    await asyncio.gather(
+        *(normalizer.normalize(_webp("u1", f"{i}.webp", f"c{i}".encode())) for i in range(5))
+    )
+
+    assert normalizer.png_calls == 5
+    assert normalizer.max_running == 2
+
+
+async def test_missing_ffmpeg_raises_unsupported_media(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(media_converter, "_ffmpeg_executable", lambda: "/nonexistent/ffmpeg")
+
+    with pytest.raises(UnsupportedMediaError, match="缺少命令 ffmpeg"):
+        await media_converter._run_ffmpeg(["-version"])
+
+
+async def test_webp_converted_to_png_in_process() -> None:
+    buffer = io.BytesIO()
+    Image.new("RGBA", (4, 4), (255, 0, 0, 128)).save(buffer, format="WEBP", lossless=True)
+
+    converted = await FfmpegMediaNormalizer().normalize(
+        _webp("u1", "sticker.webp", buffer.getvalue())
+    )
+
+    assert (converted.mime_type, converted.file_name) == ("image/png", "sticker.png")
+    with Image.open(io.BytesIO(converted.content)) as image:
+        assert image.format == "PNG"
+        assert image.getpixel((0, 0)) == (255, 0, 0, 128)
+
+
+async def test_passthrough_mimes_returned_unchanged() -> None:
+    normalizer = _CountingNormalizer()
+    asset = StickerAsset(
+        source_platform="telegram",
+        source_user_id="u1",
+        media_kind="image",
+        mime_type="IMAGE/PNG",
+        file_name="a.png",
+        content=b"png",
+    )
+
+    assert await normalizer.normalize(asset) is asset
+    assert normalizer.png_calls == 0
+
+
+async def test_gif_palette_reused_within_pack(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[list[str]] = []
+
+    async def fake_run_ffmpeg(args: list[str], input_bytes: bytes | None = None) -> bytes:
+        calls.append(args)
+        if "[palette]" in args:
+            with open(args[-1], "wb") as palette_file:
+                palette_file.write(b"palette")
+        else:
+            with open(args[args.index("-i", args.index("pipe:0")) + 1], "rb") as palette_file:
+                assert palette_file.read() == b"palette"
+        return b"gif:" + (input_bytes or b"")
+
+    monkeypatch.setattr(media_converter, "_run_ffmpeg", fake_run_ffmpeg)
+
+    def _webm(content: bytes) -> StickerAsset:
+        return StickerAsset(
+            source_platform="telegram",
+            source_user_id="u1",
+            media_kind="sticker",
+            mime_type="video/webm",
+            file_name="sticker.webm",
+            content=content,
+            is_animated=True,
+            pack_name="pack",
+        )
+
+    normalizer = FfmpegMediaNormalizer()
+    first = await normalizer.normalize(_webm(b"one"))
+    second = await normalizer.normalize(_webm(b"two"))
+    assert (first.content, second.content) == (b"gif:one", b"gif:two")
+
+    assert "[palette]" in calls[0]
+    assert media_converter._GIF_REUSE_PALETTE_FILTER in calls[1]
+
+
+def test_tgs_render_progress_silenced(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    from lottie.parsers.baseporter import IoProgressReporter
+
+    monkeypatch.setattr(IoProgressReporter, "instance", IoProgressReporter.instance)
+    try:
+        media_converter._tgs_to_gif(b"")
+    except Exception:  # noqa: BLE001 渲染后端或输入无效时失败，这里只关心进度输出
+        pass
+
+    IoProgressReporter.instance.report_progress("GIF rendering frame", 1, 2)
+    assert capsys.readouterr().err == ""
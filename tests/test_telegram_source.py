@@ -1,13 +1,15 @@
 import asyncio
 import time
-from types import SimpleNamespace
+from collections import OrderedDict
 
 from stickerhub.adapters.telegram_source import (
     BIND_MODE_CALLBACK_PREFIX,
     PACK_CALLBACK_PREFIX,
     PendingStickerPackRequest,
     PendingWebhookBindRequest,
+    PerUserUpdateProcessor,
     RunningStickerPackTask,
+    RunningStickerPackTasks,
     _cleanup_pending_requests,
     _cleanup_pending_webhook_requests,
     _deduplicate_filename,
@@ -16,33 +18,47 @@ from stickerhub.adapters.telegram_source import (
     _parse_bind_mode_callback_data,
     _parse_pack_callback_data,
     _send_single_sticker_reply,
+    _wait_for_turn,
 )
 from stickerhub.core.models import StickerAsset
 
 
+class _StickerProbe:
+    """只含 _detect_sticker_mime 用到的字段；未传 mime_type 时该属性不存在，模拟新版 PTB。"""
+
+    __slots__ = ("mime_type", "is_animated", "is_video")
+
+    def __init__(self, *, is_animated: bool, is_video: bool, mime_type: str | None = None) -> None:
+        self.is_animated = is_animated
+        self.is_video = is_video
+        if mime_type is not None:
+            self.mime_type = mime_type
+
+
 def test_detect_sticker_mime_prefers_legacy_mime_attr() -> None:
-    sticker = SimpleNamespace(mime_type="image/webp", is_animated=True, is_video=True)
+    sticker = _StickerProbe(mime_type="image/webp", is_animated=True, is_video=True)
     assert _detect_sticker_mime(sticker) == "image/webp"
 
 
 def test_detect_sticker_mime_video_when_no_legacy_mime() -> None:
-    sticker = SimpleNamespace(is_animated=False, is_video=True)
+    sticker = _StickerProbe(is_animated=False, is_video=True)
     assert _detect_sticker_mime(sticker) == "video/webm"
 
 
 def test_detect_sticker_mime_animated_when_no_legacy_mime() -> None:
-    sticker = SimpleNamespace(is_animated=True, is_video=False)
+    sticker = _StickerProbe(is_animated=True, is_video=False)
     assert _detect_sticker_mime(sticker) == "application/x-tgsticker"
 
 
 def test_detect_sticker_mime_static_when_no_legacy_mime() -> None:
-    sticker = SimpleNamespace(is_animated=False, is_video=False)
+    sticker = _StickerProbe(is_animated=False, is_video=False)
     assert _detect_sticker_mime(sticker) == "image/webp"
 
 
 def test_has_running_task_for_user() -> None:
-    running = {
-        "t1": RunningStickerPackTask(
+    running = RunningStickerPackTasks()
+    running.add(
+        RunningStickerPackTask(
             task_id="t1",
             telegram_user_id="100",
             source_user_id="100",
@@ -50,31 +66,37 @@ def test_has_running_task_for_user() -> None:
             origin_chat_id=1,
             origin_message_id=1,
         )
-    }
+    )
     assert _has_running_task_for_user(running, "100")
     assert not _has_running_task_for_user(running, "200")
 
+    running.pop("t1")
+    assert not _has_running_task_for_user(running, "100")
+    assert running.get("t1") is None
+
 
 def test_cleanup_pending_requests_removes_expired_only() -> None:
     now = int(time.time())
-    pending = {
-        "expired": PendingStickerPackRequest(
-            telegram_user_id="u1",
-            source_user_id="u1",
-            set_name="a",
-            original_sticker_unique_id="x",
-            total_count=10,
-            created_at=now - 3600,
-        ),
-        "fresh": PendingStickerPackRequest(
-            telegram_user_id="u2",
-            source_user_id="u2",
-            set_name="b",
-            original_sticker_unique_id="y",
-            total_count=10,
-            created_at=now,
-        ),
-    }
+    pending = OrderedDict(
+        {
+            "expired": PendingStickerPackRequest(
+                telegram_user_id="u1",
+                source_user_id="u1",
+                set_name="a",
+                original_sticker_unique_id="x",
+                total_count=10,
+                created_at=now - 3600,
+            ),
+            "fresh": PendingStickerPackRequest(
+                telegram_user_id="u2",
+                source_user_id="u2",
+                set_name="b",
+                original_sticker_unique_id="y",
+                total_count=10,
+                created_at=now,
+            ),
+        }
+    )
     _cleanup_pending_requests(pending)
     assert "expired" not in pending
     assert "fresh" in pending
@@ -109,6 +131,10 @@ class TestParsePackCallbackData:
         result = _parse_pack_callback_data("")
         assert result is None
 
+    def test_empty_token(self) -> None:
+        result = _parse_pack_callback_data(f"{PACK_CALLBACK_PREFIX}feishu:")
+        assert result is None
+
     def test_token_with_colon(self) -> None:
         """token 本身包含冒号时应正确分割。"""
         result = _parse_pack_callback_data(f"{PACK_CALLBACK_PREFIX}zip:token:with:colons")
@@ -150,8 +176,19 @@ class TestDeduplicateFilename:
         seen = {"sticker"}
         assert _deduplicate_filename("sticker", seen) == "sticker_1"
 
+    def test_counters_resume_after_last_suffix(self) -> None:
+        seen: set[str] = set()
+        counters: dict[str, int] = {}
+        names = []
+        for _ in range(4):
+            name = _deduplicate_filename("sticker.png", seen, counters)
+            seen.add(name)
+            names.append(name)
+        assert names == ["sticker.png", "sticker_1.png", "sticker_2.png", "sticker_3.png"]
+        assert counters == {"sticker.png": 4}
+
 
-def test_send_single_sticker_reply_animated_uses_document_not_animation() -> None:
+async def test_send_single_sticker_reply_animated_uses_document_not_animation() -> None:
     class DummyMessage:
         def __init__(self) -> None:
             self.animation_called = False
@@ -174,7 +211,7 @@ def test_send_single_sticker_reply_animated_uses_document_not_animation() -> Non
         is_animated=True,
     )
 
-    asyncio.run(_send_single_sticker_reply(message=message, normalized=asset))
+    await _send_single_sticker_reply(message=message, normalized=asset)
 
     assert message.document_called is True
     assert message.animation_called is False
@@ -182,16 +219,79 @@ def test_send_single_sticker_reply_animated_uses_document_not_animation() -> Non
 
 def test_cleanup_pending_webhook_requests_removes_expired_only() -> None:
     now = int(time.time())
-    pending = {
-        "expired_user": PendingWebhookBindRequest(
-            telegram_user_id="expired_user",
-            created_at=now - 3600,
-        ),
-        "fresh_user": PendingWebhookBindRequest(
-            telegram_user_id="fresh_user",
-            created_at=now,
-        ),
-    }
+    pending = OrderedDict(
+        {
+            "expired_user": PendingWebhookBindRequest(
+                telegram_user_id="expired_user",
+                created_at=now - 3600,
+            ),
+            "fresh_user": PendingWebhookBindRequest(
+                telegram_user_id="fresh_user",
+                created_at=now,
+            ),
+        }
+    )
     _cleanup_pending_webhook_requests(pending)
     assert "expired_user" not in pending
     assert "fresh_user" in pending
+
+
+class _UpdateProbe:
+    """只含 PerUserUpdateProcessor 用到的 effective_user。"""
+
+    def __init__(self, user_id: int) -> None:
+        self.effective_user = type("User", (), {"id": user_id})()
+
+
+async def test_per_user_updates_prepared_concurrently_and_relayed_in_order() -> None:
+    processor = PerUserUpdateProcessor(10)
+    events: list[str] = []
+
+    async def handle(name: str, prepare_delay: float) -> None:
+        # 模拟 handle_message：先准备（下载、转换、上传），再按到达顺序转发
+        events.append(f"{name} start")
+        await asyncio.sleep(prepare_delay)
+        events.append(f"{name} prepared")
+        await _wait_for_turn()
+        events.append(f"{name} relayed")
+
+    await asyncio.gather(
+        processor.process_update(_UpdateProbe(1), handle("first", 0.05)),
+        processor.process_update(_UpdateProbe(1), handle("second", 0)),
+    )
+
+    # 第二条的准备与第一条重叠，转发仍在第一条之后
+    assert events.index("second prepared") < events.index("first prepared")
+    assert [event for event in events if event.endswith("relayed")] == [
+        "first relayed",
+        "second relayed",
+    ]
+    assert processor._users == {}
+
+
+async def test_per_user_burst_does_not_block_other_users() -> None:
+    processor = PerUserUpdateProcessor(2)
+    release = asyncio.Event()
+    relayed: list[str] = []
+
+    async def burst_item(index: int) -> None:
+        await release.wait()
+        await _wait_for_turn()
+        relayed.append(f"u1-{index}")
+
+    async def other_user() -> None:
+        await _wait_for_turn()
+        relayed.append("u2")
+
+    burst = [
+        asyncio.create_task(processor.process_update(_UpdateProbe(1), burst_item(index)))
+        for index in range(5)
+    ]
+    await asyncio.wait_for(processor.process_update(_UpdateProbe(2), other_user()), timeout=1)
+    assert relayed == ["u2"]
+
+    release.set()
+    await asyncio.gather(*burst)
+    assert relayed == ["u2", "u1-0", "u1-1", "u1-2", "u1-3", "u1-4"]
+    assert processor._user_slots._value == 2
+    assert processor._users == {}